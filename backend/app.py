@@ -1,14 +1,18 @@
 """
 Aplicación principal Flask
 """
-from flask import Flask, send_from_directory, session
+from flask import Flask, session
 from flask_cors import CORS
 import os
 
-from database import init_db
+import vencimientos
+from assets import Estaticos
+from database import init_db, init_app
+from respuestas import init_app as init_compresion
 from routes import api
 
-app = Flask(__name__, static_folder='../frontend', static_url_path='')
+# Los estáticos los sirve serve_static (ver assets.py), no la ruta static de Flask
+app = Flask(__name__, static_folder=None)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
@@ -16,17 +20,29 @@ app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 # Habilitar CORS
 CORS(app, supports_credentials=True)
 
+# Conexiones a la base de datos por petición
+init_app(app)
+
+# Compresión gzip/brotli de las respuestas de la API
+init_compresion(app)
+
+# Marca las tareas retrasadas cuando vencen (planificador por proceso)
+vencimientos.init_app(app)
+
 # Registrar blueprint de API
 app.register_blueprint(api)
 
+# dist/ construido con `python assets.py`, o frontend/ si no existe
+estaticos = Estaticos()
+
 # Ruta para servir archivos estáticos
 @app.route('/')
 def index():
-    return send_from_directory(app.static_folder, 'index.html')
+    return estaticos.enviar('index.html')
 
 @app.route('/<path:path>')
 def serve_static(path):
-    return send_from_directory(app.static_folder, path)
+    return estaticos.enviar(path)
 
 # La base de datos se inicializa al ejecutar el servidor
 
@@ -43,5 +59,6 @@ if __name__ == '__main__':
     print("  Contraseña: admin123")
     print("=" * 50)
     
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Servidor de desarrollo; en producción usar servidor.py
+    app.run(debug=os.environ.get('FLASK_DEBUG', '1') == '1', host='0.0.0.0', port=5000)
 
@@ -0,0 +1,162 @@
+"""
+Construcción y envío de los archivos estáticos del frontend
+
+La construcción copia frontend/ a dist/, renombra CSS y JS con un hash de su
+contenido (styles.css -> styles.3f9a1c2b7e04.css), reescribe las referencias
+en el HTML y deja junto a cada archivo de texto sus variantes .gz y .br
+precomprimidas. Los archivos con hash no cambian nunca, así que se sirven
+con caché inmutable; el HTML se revalida siempre.
+
+Uso:
+    python assets.py    # construye dist/ desde frontend/
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+from flask import abort, request, send_from_directory
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FRONTEND = os.path.join(RAIZ, 'frontend')
+DIST = os.environ.get('ASSETS_DIR', os.path.join(RAIZ, 'dist'))
+MANIFEST = 'manifest.json'
+
+# Extensiones que reciben hash en el nombre y las que se precomprimen
+CON_HASH = {'.css', '.js'}
+COMPRIMIBLES = {'.html', '.css', '.js', '.json', '.svg', '.txt'}
+# Bytes mínimos para que merezca la pena guardar una variante comprimida
+COMPRESION_MINIMO = 256
+CACHE_INMUTABLE = 'public, max-age=31536000, immutable'
+
+def _nombre_con_hash(ruta, contenido):
+    """styles.css -> styles.<hash>.css"""
+    base, extension = os.path.splitext(ruta)
+    return f'{base}.{hashlib.sha256(contenido).hexdigest()[:12]}{extension}'
+
+def _reescribir(html, manifest):
+    """Sustituye en el HTML las referencias entre comillas a los archivos con hash"""
+    for original, con_hash in manifest.items():
+        patron = r'(?<=["\'])' + re.escape(original) + r'(?=["\'?#])'
+        html = re.sub(patron, con_hash, html)
+    return html
+
+def _precomprimir(ruta):
+    """Escribe las variantes .gz y .br de un archivo"""
+    with open(ruta, 'rb') as f:
+        datos = f.read()
+    if len(datos) < COMPRESION_MINIMO:
+        return
+    
+    # mtime=0: la misma entrada produce siempre el mismo .gz
+    with open(ruta + '.gz', 'wb') as f:
+        f.write(gzip.compress(datos, 9, mtime=0))
+    if brotli:
+        with open(ruta + '.br', 'wb') as f:
+            f.write(brotli.compress(datos, quality=11))
+
+def construir(origen=FRONTEND, destino=DIST):
+    """Construye los estáticos en destino y devuelve el manifest"""
+    # Se construye aparte y se sustituye al final para no servir una mitad
+    temporal = destino + '.tmp'
+    shutil.rmtree(temporal, ignore_errors=True)
+    
+    archivos = []
+    for directorio, _, nombres in os.walk(origen):
+        for nombre in nombres:
+            archivos.append(os.path.relpath(os.path.join(directorio, nombre), origen))
+    
+    manifest = {}
+    for relativa in sorted(archivos):
+        url = '/' + relativa.replace(os.sep, '/')
+        with open(os.path.join(origen, relativa), 'rb') as f:
+            contenido = f.read()
+        
+        if os.path.splitext(relativa)[1] in CON_HASH:
+            relativa = _nombre_con_hash(relativa, contenido)
+            manifest[url] = '/' + relativa.replace(os.sep, '/')
+        
+        salida = os.path.join(temporal, relativa)
+        os.makedirs(os.path.dirname(salida), exist_ok=True)
+        with open(salida, 'wb') as f:
+            f.write(contenido)
+    
+    for relativa in archivos:
+        if relativa.endswith('.html'):
+            salida = os.path.join(temporal, relativa)
+            with open(salida, encoding='utf-8') as f:
+                html = _reescribir(f.read(), manifest)
+            with open(salida, 'w', encoding='utf-8') as f:
+                f.write(html)
+    
+    for directorio, _, nombres in os.walk(temporal):
+        for nombre in nombres:
+            if os.path.splitext(nombre)[1] in COMPRIMIBLES:
+                _precomprimir(os.path.join(directorio, nombre))
+    
+    with open(os.path.join(temporal, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    
+    shutil.rmtree(destino, ignore_errors=True)
+    os.replace(temporal, destino)
+    return manifest
+
+def cargar_manifest(directorio=DIST):
+    """Manifest de una construcción previa, o None si no existe"""
+    try:
+        with open(os.path.join(directorio, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+class Estaticos:
+    """Sirve dist/ si se ha construido o, si no, frontend/ tal cual"""
+    
+    def __init__(self, construido=DIST, original=FRONTEND):
+        manifest = cargar_manifest(construido)
+        self.directorio = construido if manifest is not None else original
+        self.inmutables = set(manifest.values()) if manifest else set()
+    
+    def _variante(self, ruta):
+        """Mejor variante precomprimida aceptada por el cliente: (sufijo, codificación)"""
+        disponibles = [codificacion for codificacion, sufijo in (('br', '.br'), ('gzip', '.gz'))
+                       if os.path.isfile(ruta + sufijo)]
+        codificacion = request.accept_encodings.best_match(disponibles) if disponibles else None
+        if codificacion is None:
+            return '', None
+        return ('.br' if codificacion == 'br' else '.gz'), codificacion
+    
+    def enviar(self, path):
+        """Respuesta para un archivo estático, con su variante y caché adecuadas"""
+        ruta = safe_join(self.directorio, path)
+        if ruta is None or not os.path.isfile(ruta):
+            abort(404)
+        
+        sufijo, codificacion = self._variante(ruta)
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        response = send_from_directory(self.directorio, path + sufijo, mimetype=mimetype)
+        
+        if codificacion:
+            response.headers['Content-Encoding'] = codificacion
+        if os.path.splitext(path)[1] in COMPRIMIBLES:
+            response.vary.add('Accept-Encoding')
+        
+        if '/' + path in self.inmutables:
+            response.headers['Cache-Control'] = CACHE_INMUTABLE
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+if __name__ == '__main__':
+    manifest = construir()
+    for original, con_hash in sorted(manifest.items()):
+        print(f"  {original} -> {con_hash}")
+    print(f"✓ Estáticos construidos en {DIST}" + ('' if brotli else ' (sin brotli: solo .gz)'))
@@ -1,15 +1,124 @@
 """
 Módulo de autenticación y autorización
+
+La sesión (cookie firmada por Flask) y los tokens Bearer (firmados con
+itsdangerous) llevan las credenciales completas: id, nombre, email, rol y la
+época de sesión del usuario. Autorizar una petición solo requiere comprobar
+la firma y que la época siga vigente en la tabla de épocas del proceso;
+revocar las sesiones de un usuario (o cambiar su rol) incrementa su época y
+deja inválidas todas las credenciales anteriores.
 """
+import os
+import threading
+import time
 from functools import wraps
-from flask import session, redirect, url_for, request, jsonify
+from flask import current_app, g, has_request_context, session, redirect, url_for, request, jsonify
+from itsdangerous import BadSignature, URLSafeTimedSerializer
 from models import Usuario
 
+# Segundos que se recuerda una decisión de permisos entre peticiones; 0 la desactiva
+PERMISOS_CACHE_TTL = float(os.environ.get('PERMISOS_CACHE_TTL', '0'))
+PERMISOS_CACHE_MAX = 10000
+
+_permisos_cache = {}
+_permisos_lock = threading.Lock()
+
+# Segundos entre comprobaciones de cambios en usuarios hechos por otros procesos
+AUTH_EPOCAS_TTL = float(os.environ.get('AUTH_EPOCAS_TTL', '5'))
+# Validez de un token Bearer en segundos
+TOKEN_DURACION = int(os.environ.get('TOKEN_DURACION', str(12 * 3600)))
+
+class TablaEpocas:
+    """Época de sesión vigente de cada usuario, en memoria del proceso
+    
+    Se recarga en cuanto este proceso escribe en usuarios (Usuario.version) y,
+    para los cambios de otros procesos, cuando versiones_datos lo indica; esa
+    comprobación se hace como mucho una vez cada AUTH_EPOCAS_TTL segundos.
+    Las épocas solo crecen: una credencial con una época posterior a la de la
+    tabla (p. ej. un login atendido por otro proceso) fuerza la comprobación.
+    """
+    
+    def __init__(self, ttl=AUTH_EPOCAS_TTL):
+        self.ttl = ttl
+        self._epocas = {}
+        self._version_local = None
+        self._version_datos = None
+        self._comprobado = 0.0
+        self._lock = threading.Lock()
+    
+    def vigente(self, user_id, epoca):
+        """Indica si la época de una credencial sigue siendo la del usuario"""
+        if self._version_local != Usuario.version or time.monotonic() >= self._comprobado + self.ttl:
+            self._refrescar()
+        
+        actual = self._epocas.get(user_id)
+        if actual is None or actual < epoca:
+            self._refrescar(forzar=True)
+            actual = self._epocas.get(user_id)
+        return actual == epoca
+    
+    def _refrescar(self, forzar=False):
+        with self._lock:
+            ahora = time.monotonic()
+            if not forzar and self._version_local == Usuario.version and ahora < self._comprobado + self.ttl:
+                return
+            
+            version_local = Usuario.version
+            version_datos = Usuario.version_datos()
+            if version_datos != self._version_datos:
+                self._epocas = Usuario.obtener_epocas()
+                self._version_datos = version_datos
+            self._version_local = version_local
+            self._comprobado = ahora
+
+tabla_epocas = TablaEpocas()
+
+def _serializador():
+    return URLSafeTimedSerializer(current_app.secret_key, salt='token-api')
+
+def _credenciales_de(user):
+    return {
+        'id': user['id'],
+        'nombre': user['nombre'],
+        'email': user['email'],
+        'rol': user['rol'],
+        'epoca': user['epoca_sesion']
+    }
+
+def iniciar_sesion(user):
+    """Guarda las credenciales del usuario en la sesión"""
+    session.clear()
+    session['credenciales'] = _credenciales_de(user)
+
+def emitir_token(user):
+    """Token Bearer firmado con las mismas credenciales que la sesión"""
+    return _serializador().dumps(_credenciales_de(user))
+
+def _leer_credenciales():
+    """Credenciales del token Bearer o de la sesión, sin validar la época"""
+    cabecera = request.headers.get('Authorization', '')
+    if cabecera.startswith('Bearer '):
+        try:
+            return _serializador().loads(cabecera[7:], max_age=TOKEN_DURACION)
+        except BadSignature:
+            return None
+    return session.get('credenciales')
+
+def get_credenciales():
+    """Credenciales vigentes de la petición actual, o None
+    
+    Solo se comprueba la firma y la época en memoria: no hay consulta.
+    """
+    credenciales = _leer_credenciales()
+    if credenciales is None or not tabla_epocas.vigente(credenciales['id'], credenciales['epoca']):
+        return None
+    return credenciales
+
 def login_required(f):
     """Decorador para requerir autenticación"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
+        if get_credenciales() is None:
             return jsonify({'error': 'No autenticado'}), 401
         return f(*args, **kwargs)
     return decorated_function
@@ -19,11 +128,11 @@ def role_required(roles):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            if 'user_id' not in session:
+            credenciales = get_credenciales()
+            if credenciales is None:
                 return jsonify({'error': 'No autenticado'}), 401
             
-            user = Usuario.obtener_por_id(session['user_id'])
-            if not user or user['rol'] not in roles:
+            if credenciales['rol'] not in roles:
                 return jsonify({'error': 'Acceso denegado'}), 403
             
             return f(*args, **kwargs)
@@ -31,32 +140,49 @@ def role_required(roles):
     return decorator
 
 def get_current_user():
-    """Obtiene el usuario actual de la sesión"""
-    if 'user_id' not in session:
+    """Obtiene el usuario actual a partir de sus credenciales, sin consultar la base de datos"""
+    credenciales = get_credenciales()
+    if credenciales is None:
         return None
-    return Usuario.obtener_por_id(session['user_id'])
+    return {clave: credenciales[clave] for clave in ('id', 'nombre', 'email', 'rol')}
+
+def _permiso_en_cache(clave):
+    """Decisión de permisos vigente en la caché del proceso, o None"""
+    if PERMISOS_CACHE_TTL <= 0:
+        return None
+    with _permisos_lock:
+        entrada = _permisos_cache.get(clave)
+    if entrada and entrada[0] > time.monotonic():
+        return entrada[1]
+    return None
+
+def _guardar_permiso(clave, decision):
+    """Recuerda una decisión de permisos durante PERMISOS_CACHE_TTL segundos"""
+    if PERMISOS_CACHE_TTL <= 0:
+        return
+    with _permisos_lock:
+        if len(_permisos_cache) >= PERMISOS_CACHE_MAX:
+            _permisos_cache.clear()
+        _permisos_cache[clave] = (time.monotonic() + PERMISOS_CACHE_TTL, decision)
 
 def verificar_permisos_proyecto(usuario, proyecto_id):
-    """Verifica si un usuario tiene permisos sobre un proyecto"""
-    from models import Proyecto
+    """Verifica si un usuario tiene permisos sobre un proyecto
     
-    proyecto = Proyecto.obtener_por_id(proyecto_id)
-    if not proyecto:
-        return False
-    
-    # Administrador tiene acceso a todos los proyectos
-    if usuario['rol'] == 'Administrador':
-        return True
+    Administrador accede a cualquier proyecto existente, Gestor a los que
+    dirige y Colaborador a aquellos donde tiene tareas asignadas. La decisión
+    se memoriza durante la petición y, si PERMISOS_CACHE_TTL > 0, en el proceso.
+    """
+    from models import Proyecto
     
-    # Gestor solo tiene acceso a sus proyectos
-    if usuario['rol'] == 'Gestor':
-        return proyecto['responsable_id'] == usuario['id']
+    clave = (usuario['id'], usuario['rol'], proyecto_id)
+    memo = g.setdefault('permisos_proyecto', {}) if has_request_context() else {}
+    if clave in memo:
+        return memo[clave]
     
-    # Colaborador solo puede ver proyectos donde tiene tareas
-    if usuario['rol'] == 'Colaborador':
-        from models import Tarea
-        tareas = Tarea.obtener_por_proyecto(proyecto_id)
-        return any(tarea['asignado_a_id'] == usuario['id'] for tarea in tareas)
+    decision = _permiso_en_cache(clave)
+    if decision is None:
+        decision = Proyecto.tiene_acceso(proyecto_id, usuario['id'], usuario['rol'])
+        _guardar_permiso(clave, decision)
     
-    return False
-
+    memo[clave] = decision
+    return decision
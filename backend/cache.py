@@ -0,0 +1,118 @@
+"""
+Caché de reportes en la memoria del proceso
+
+Cada reporte se guarda con la versión de los datos (versiones_datos, que
+mantienen los triggers) con la que se calculó. Cualquier escritura en tareas
+o proyectos, de este proceso o de otro, cambia esa versión y deja obsoletos
+los reportes guardados, así que no hace falta invalidarlos uno a uno ni
+escribir en la base de datos para guardarlos.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from database import get_db_connection
+
+# Segundos de validez de un reporte guardado; 0 desactiva la caché
+REPORTES_CACHE_TTL = int(os.environ.get('REPORTES_CACHE_TTL', '300'))
+# Reportes guardados por proceso; al superarlo se descartan los menos usados
+REPORTES_CACHE_MAX = int(os.environ.get('REPORTES_CACHE_MAX', '1024'))
+
+# Versión conjunta de las tablas de las que dependen los reportes (triggers de la migración 7)
+VERSION_DATOS = '''
+    SELECT COALESCE(SUM(version), 0) FROM versiones_datos
+    WHERE ambito IN ('proyectos', 'tareas')
+'''
+
+class CacheReportes:
+    """Guarda métricas serializadas por (tipo, proyecto_id, usuario_id)"""
+    
+    def __init__(self, ttl=REPORTES_CACHE_TTL, max_entradas=REPORTES_CACHE_MAX):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        # clave -> (versión de los datos, instante de caducidad, datos en JSON)
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+    
+    def _contar(self, atributo):
+        with self._lock:
+            setattr(self, atributo, getattr(self, atributo) + 1)
+    
+    def version_datos(self):
+        """Versión de los datos que leerá un cálculo que empiece ahora"""
+        return get_db_connection().execute(VERSION_DATOS).fetchone()[0]
+    
+    def obtener(self, tipo, version, proyecto_id=None, usuario_id=None):
+        """Obtiene un reporte calculado con `version` y aún no caducado, o None"""
+        if self.ttl <= 0:
+            return None
+        
+        clave = (tipo, proyecto_id, usuario_id)
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return None
+            version_guardada, caduca, datos = entrada
+            if version_guardada != version or caduca <= time.monotonic():
+                del self._entradas[clave]
+                return None
+            self._entradas.move_to_end(clave)
+        # Una copia nueva en cada acierto: quien la recibe puede modificarla
+        return json.loads(datos)
+    
+    def guardar(self, tipo, datos, version, proyecto_id=None, usuario_id=None):
+        """Guarda un reporte reemplazando el anterior de la misma clave
+        
+        version es la de version_datos() antes de calcular datos: si alguna
+        escritura se confirmó entretanto, el reporte ya no coincidirá con la
+        versión actual y el siguiente obtener() lo descartará.
+        """
+        if self.ttl <= 0:
+            return
+        
+        clave = (tipo, proyecto_id, usuario_id)
+        entrada = (version, time.monotonic() + self.ttl, json.dumps(datos))
+        with self._lock:
+            self._entradas[clave] = entrada
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+    
+    def obtener_o_calcular(self, tipo, calcular, proyecto_id=None, usuario_id=None):
+        """Devuelve el reporte en caché o lo calcula y lo guarda"""
+        version = self.version_datos()
+        datos = self.obtener(tipo, version, proyecto_id, usuario_id)
+        if datos is not None:
+            self._contar('aciertos')
+            return datos
+        
+        self._contar('fallos')
+        datos = calcular()
+        self.guardar(tipo, datos, version, proyecto_id, usuario_id)
+        return datos
+    
+    def limpiar(self):
+        """Vacía la caché de reportes de este proceso"""
+        with self._lock:
+            self._entradas.clear()
+        self._contar('invalidaciones')
+    
+    def estadisticas(self):
+        """Aciertos, fallos e invalidaciones de este proceso"""
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'ttl': self.ttl,
+                'entradas': len(self._entradas),
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'invalidaciones': self.invalidaciones,
+                'tasa_aciertos': round(self.aciertos / consultas, 4) if consultas else 0
+            }
+
+cache_reportes = CacheReportes()
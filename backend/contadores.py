@@ -0,0 +1,29 @@
+"""
+Script para verificar o reconstruir la tabla tareas_contadores
+
+Uso:
+    python contadores.py               # solo verifica
+    python contadores.py --reconstruir # reconstruye si hay diferencias
+"""
+import sys
+
+from database import release_thread_connection
+from models import Reporte
+
+if __name__ == '__main__':
+    diferencias = Reporte.verificar_contadores()
+    
+    if not diferencias:
+        print("✓ Los contadores de tareas son consistentes")
+    else:
+        print(f"✗ {len(diferencias)} contadores no coinciden con las tareas:")
+        for d in diferencias:
+            print(f"  proyecto={d['proyecto_id']} asignado={d['asignado_a_id']} "
+                  f"estado={d['estado']}: real={d['real']} contador={d['contado']}")
+        
+        if '--reconstruir' in sys.argv:
+            Reporte.reconstruir_contadores()
+            print("✓ Contadores reconstruidos")
+    
+    release_thread_connection()
+    sys.exit(1 if diferencias and '--reconstruir' not in sys.argv else 0)
@@ -1,21 +1,460 @@
 """
 Configuración de la base de datos
+
+Las lecturas usan un pool de conexiones de solo lectura (mode=ro) y todas las
+escrituras pasan por un único hilo escritor por proceso (ejecutar_escritura),
+de modo que dentro del proceso nunca compiten dos escritores. Con la base de
+datos en modo WAL las lecturas no esperan a las escrituras; entre procesos,
+busy_timeout y los reintentos del escritor resuelven los bloqueos.
 """
+import os
+import queue
 import sqlite3
+import threading
+import time
+import urllib.parse
+from concurrent.futures import Future, TimeoutError as TiempoAgotado
 from datetime import datetime
+from flask import g, has_app_context, jsonify
 from werkzeug.security import generate_password_hash
 
+from migrations import aplicar_migraciones
+
 DATABASE = 'proyectos.db'
 
-def get_db_connection():
-    """Obtiene una conexión a la base de datos"""
-    conn = sqlite3.connect(DATABASE)
+# Tamaño máximo del pool y de la caché de sentencias preparadas por conexión
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '10'))
+STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE', '128'))
+# Milisegundos que SQLite espera por un bloqueo antes de fallar
+BUSY_TIMEOUT = int(os.environ.get('DB_BUSY_TIMEOUT', '5000'))
+# Reintentos de una escritura que sigue bloqueada tras BUSY_TIMEOUT
+REINTENTOS_ESCRITURA = int(os.environ.get('DB_REINTENTOS_ESCRITURA', '3'))
+# Commit en grupo: escrituras por transacción (1 = desactivado) y milisegundos
+# que se espera a que se sumen otras antes de confirmar
+GRUPO_OPERACIONES = int(os.environ.get('DB_GRUPO_OPERACIONES', '1'))
+GRUPO_ESPERA_MS = float(os.environ.get('DB_GRUPO_ESPERA_MS', '2'))
+# Segundos que una petición espera a que se confirme su escritura
+ESCRITURA_TIMEOUT = float(os.environ.get('DB_ESCRITURA_TIMEOUT', '30'))
+# PRAGMA synchronous del escritor; FULL sincroniza el disco en cada commit
+SINCRONIZACION = os.environ.get('DB_SYNCHRONOUS', 'FULL').upper()
+if SINCRONIZACION not in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+    raise ValueError(f'DB_SYNCHRONOUS no válido: {SINCRONIZACION}')
+
+# Rango de los enteros de SQLite; enlazar un int fuera de él lanza OverflowError
+ENTERO_MIN, ENTERO_MAX = -2 ** 63, 2 ** 63 - 1
+
+def conectar(database, solo_lectura=False):
+    """Abre una conexión configurada a la base de datos"""
+    if solo_lectura:
+        uri = 'file:' + urllib.parse.quote(os.path.abspath(database)) + '?mode=ro'
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+    else:
+        conn = sqlite3.connect(database, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
     conn.row_factory = sqlite3.Row
+    # PRAGMA no admite parámetros; el valor es siempre un entero propio
+    conn.execute(f'PRAGMA busy_timeout = {int(BUSY_TIMEOUT)}')
     return conn
 
+class ConnectionPool:
+    """Pool de conexiones SQLite de solo lectura reutilizables entre peticiones"""
+    
+    def __init__(self, database, max_size=POOL_SIZE):
+        self.database = database
+        self.max_size = max_size
+        self._idle = queue.LifoQueue(maxsize=max_size)
+    
+    def _crear_conexion(self):
+        """Abre una nueva conexión configurada"""
+        # check_same_thread=False: la conexión puede volver al pool desde
+        # un hilo distinto al que la creó, pero nunca se usa en dos a la vez
+        return conectar(self.database, solo_lectura=True)
+    
+    def acquire(self):
+        """Obtiene una conexión libre del pool o abre una nueva"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._crear_conexion()
+    
+    def release(self, conn):
+        """Devuelve una conexión al pool, cerrándola si está lleno"""
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+    
+    def close_all(self):
+        """Cierra todas las conexiones libres del pool"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+class Deshacer(Exception):
+    """Lanzada por una función de escritura para deshacer su transacción
+    
+    ejecutar_escritura devuelve `resultado` en lugar de propagar la excepción.
+    """
+    
+    def __init__(self, resultado=None):
+        super().__init__()
+        self.resultado = resultado
+
+class EscritorNoDisponible(Exception):
+    """El hilo escritor terminó o no confirmó la escritura a tiempo (HTTP 503)"""
+
+def _es_bloqueo(error):
+    mensaje = str(error).lower()
+    return 'locked' in mensaje or 'busy' in mensaje
+
+class Escritor(threading.Thread):
+    """Hilo que ejecuta en serie las escrituras del proceso
+    
+    Con grupo_max > 1 (commit en grupo) junta las escrituras que llegan casi a
+    la vez en una sola transacción, cada una en su SAVEPOINT: un único COMMIT
+    (y un único fsync) por lote. Cada llamador sigue esperando hasta que su
+    lote está confirmado, así que la durabilidad no cambia; si una escritura
+    falla, solo se deshace su SAVEPOINT.
+    """
+    
+    def __init__(self, database, grupo_max=GRUPO_OPERACIONES, grupo_espera=GRUPO_ESPERA_MS / 1000):
+        super().__init__(name='escritor-db', daemon=True)
+        self.database = database
+        self.grupo_max = max(1, grupo_max)
+        self.grupo_espera = grupo_espera
+        self.conn = None
+        # Excepción que terminó el hilo, si terminó por un error
+        self.caido = None
+        self._cola = queue.Queue()
+        self._lock = threading.Lock()
+        self.escrituras = 0
+        self.errores = 0
+        self.reintentos = 0
+        self.esperas_bloqueo = 0
+        self.tiempo_bloqueo = 0.0
+        self.max_espera_bloqueo = 0.0
+        self.max_cola = 0
+        self.lotes = 0
+        self.max_lote = 0
+        self.agotadas = 0
+    
+    def enviar(self, fn, timeout=ESCRITURA_TIMEOUT):
+        """Encola fn(conn) y espera su resultado (o su excepción)
+        
+        Lanza EscritorNoDisponible si el hilo ya no está en marcha o si la
+        escritura no se confirma en `timeout` segundos; en ese caso se cancela
+        si aún no había empezado.
+        """
+        if self.caido is not None or not self.is_alive():
+            raise EscritorNoDisponible('El escritor de la base de datos no está en marcha')
+        
+        futuro = Future()
+        self._cola.put((fn, futuro))
+        with self._lock:
+            self.max_cola = max(self.max_cola, self._cola.qsize())
+        try:
+            return futuro.result(timeout=timeout)
+        except TiempoAgotado as e:
+            futuro.cancel()
+            with self._lock:
+                self.agotadas += 1
+            raise EscritorNoDisponible('La escritura no se confirmó a tiempo') from e
+    
+    def parar(self):
+        """Termina el hilo después de las escrituras ya encoladas"""
+        self._cola.put(None)
+    
+    def run(self):
+        try:
+            self._atender()
+        except BaseException as e:
+            self.caido = e
+            self._fallar_pendientes(e)
+            raise
+    
+    def _fallar_pendientes(self, causa):
+        """Responde con error a las escrituras encoladas cuando el hilo cae"""
+        while True:
+            try:
+                tarea = self._cola.get_nowait()
+            except queue.Empty:
+                break
+            if tarea is not None and tarea[1].set_running_or_notify_cancel():
+                error = EscritorNoDisponible('El escritor de la base de datos terminó')
+                error.__cause__ = causa
+                tarea[1].set_exception(error)
+    
+    def _atender(self):
+        """Bucle del hilo: ejecuta los lotes de escrituras hasta que se pide parar"""
+        self.conn = conectar(self.database)
+        # Transacciones explícitas: BEGIN IMMEDIATE / COMMIT en _ejecutar_lote
+        self.conn.isolation_level = None
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute(f'PRAGMA synchronous = {SINCRONIZACION}')
+        
+        parar = False
+        while not parar:
+            lote, parar = self._siguiente_lote()
+            # Las canceladas por timeout mientras esperaban en la cola no se ejecutan
+            lote = [(fn, futuro) for fn, futuro in lote if futuro.set_running_or_notify_cancel()]
+            if not lote:
+                continue
+            
+            try:
+                resultados = self._ejecutar_lote([fn for fn, _ in lote])
+            except BaseException as e:
+                resultados = [(None, e)] * len(lote)
+            
+            fallidas = 0
+            for (_, futuro), (resultado, error) in zip(lote, resultados):
+                if error is None:
+                    futuro.set_result(resultado)
+                else:
+                    fallidas += 1
+                    futuro.set_exception(error)
+            
+            with self._lock:
+                self.escrituras += len(lote) - fallidas
+                self.errores += fallidas
+                self.lotes += 1
+                self.max_lote = max(self.max_lote, len(lote))
+        
+        self.conn.close()
+    
+    def _siguiente_lote(self):
+        """Espera una escritura y junta las que lleguen hasta llenar el lote
+        
+        Devuelve (lote, parar); parar indica que se pidió terminar el hilo.
+        """
+        primera = self._cola.get()
+        if primera is None:
+            return [], True
+        
+        lote = [primera]
+        limite = time.monotonic() + self.grupo_espera
+        while len(lote) < self.grupo_max:
+            restante = limite - time.monotonic()
+            try:
+                tarea = self._cola.get(timeout=restante) if restante > 0 else self._cola.get_nowait()
+            except queue.Empty:
+                break
+            if tarea is None:
+                return lote, True
+            lote.append(tarea)
+        return lote, False
+    
+    def _registrar_espera(self, segundos):
+        with self._lock:
+            self.tiempo_bloqueo += segundos
+            self.max_espera_bloqueo = max(self.max_espera_bloqueo, segundos)
+            # Por debajo de un milisegundo no hubo que esperar a otro proceso
+            if segundos >= 0.001:
+                self.esperas_bloqueo += 1
+    
+    def _ejecutar_lote(self, funciones):
+        """Ejecuta las funciones en una transacción, reintentando si la base está bloqueada
+        
+        Devuelve una lista de (resultado, excepción), una por función.
+        """
+        for intento in range(REINTENTOS_ESCRITURA + 1):
+            try:
+                inicio = time.monotonic()
+                self.conn.execute('BEGIN IMMEDIATE')
+                self._registrar_espera(time.monotonic() - inicio)
+                
+                resultados = [self._ejecutar_operacion(fn) for fn in funciones]
+                self.conn.execute('COMMIT')
+                return resultados
+            except BaseException as e:
+                if self.conn.in_transaction:
+                    self.conn.execute('ROLLBACK')
+                if (not isinstance(e, sqlite3.OperationalError) or not _es_bloqueo(e)
+                        or intento == REINTENTOS_ESCRITURA):
+                    raise
+                with self._lock:
+                    self.reintentos += 1
+                time.sleep(min(0.05 * 2 ** intento, 1.0))
+    
+    def _ejecutar_operacion(self, fn):
+        """Ejecuta fn en su SAVEPOINT y devuelve (resultado, excepción)
+        
+        Un bloqueo de la base de datos no se captura: repite el lote entero.
+        """
+        self.conn.execute('SAVEPOINT operacion')
+        try:
+            resultado = fn(self.conn)
+        except Exception as e:
+            if isinstance(e, sqlite3.OperationalError) and _es_bloqueo(e):
+                raise
+            self.conn.execute('ROLLBACK TO operacion')
+            self.conn.execute('RELEASE operacion')
+            if isinstance(e, Deshacer):
+                return e.resultado, None
+            return None, e
+        
+        self.conn.execute('RELEASE operacion')
+        return resultado, None
+    
+    def estadisticas(self):
+        """Profundidad de la cola, escrituras, lotes, reintentos y esperas por bloqueo"""
+        with self._lock:
+            return {
+                'cola_escritura': self._cola.qsize(),
+                'max_cola_escritura': self.max_cola,
+                'escrituras': self.escrituras,
+                'errores': self.errores,
+                'reintentos': self.reintentos,
+                'esperas_bloqueo': self.esperas_bloqueo,
+                'tiempo_bloqueo': round(self.tiempo_bloqueo, 4),
+                'max_espera_bloqueo': round(self.max_espera_bloqueo, 4),
+                'lotes': self.lotes,
+                'max_lote': self.max_lote,
+                'escrituras_por_lote': round(self.escrituras / self.lotes, 2) if self.lotes else 0,
+                'escrituras_agotadas': self.agotadas
+            }
+
+_pool = None
+_escritor = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+def get_pool():
+    """Obtiene el pool de conexiones de lectura, creándolo si no existe"""
+    global _pool
+    if _pool is None or _pool.database != DATABASE:
+        with _pool_lock:
+            if _pool is None or _pool.database != DATABASE:
+                if _pool is not None:
+                    _pool.close_all()
+                _pool = ConnectionPool(DATABASE)
+    return _pool
+
+def get_escritor():
+    """Obtiene el hilo escritor del proceso, arrancándolo si no existe o terminó"""
+    global _escritor
+    if _escritor is None or _escritor.database != DATABASE or not _escritor.is_alive():
+        with _pool_lock:
+            if _escritor is None or _escritor.database != DATABASE or not _escritor.is_alive():
+                if _escritor is not None:
+                    _escritor.parar()
+                _escritor = Escritor(DATABASE)
+                _escritor.start()
+    return _escritor
+
+def ejecutar_escritura(fn):
+    """Ejecuta fn(conn) en el hilo escritor, dentro de una transacción
+    
+    fn no debe hacer commit ni rollback: sus cambios se confirman al
+    terminar fn y se deshacen si lanza una excepción (o Deshacer). Devuelve
+    lo que devuelva fn, una vez confirmado (con el commit en grupo, cuando
+    se confirma su lote). Los efectos fuera de la base de datos (eventos,
+    cachés en memoria) van después, cuando la escritura ya es visible.
+    """
+    escritor = get_escritor()
+    if threading.current_thread() is escritor:
+        # Escritura anidada: forma parte de la transacción en curso
+        return fn(escritor.conn)
+    return escritor.enviar(fn)
+
+def get_db_connection():
+    """Obtiene la conexión de lectura de la petición o hilo actual
+    
+    Dentro de una petición la conexión se guarda en flask.g y se devuelve al
+    pool en el teardown; fuera de ella se reutiliza una conexión por hilo.
+    Los llamadores no deben cerrarla. Es de solo lectura: para escribir se
+    usa ejecutar_escritura.
+    """
+    if has_app_context():
+        if 'db' not in g:
+            g.db = get_pool().acquire()
+        return g.db
+    
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = _local.conn = get_pool().acquire()
+    return conn
+
+def registrar_cursor(cursor):
+    """Anota un cursor que se recorre en flujo para cerrarlo en el teardown
+    
+    Una sentencia SELECT sin terminar mantiene abierta la instantánea de
+    lectura (WAL): la conexión vería datos antiguos al volver al pool.
+    """
+    if has_app_context():
+        g.setdefault('cursores_en_flujo', []).append(cursor)
+
+def close_db(exception=None):
+    """Devuelve al pool la conexión de la petición actual"""
+    for cursor in g.pop('cursores_en_flujo', ()):
+        cursor.close()
+    conn = g.pop('db', None)
+    if conn is not None:
+        get_pool().release(conn)
+
+def release_thread_connection():
+    """Devuelve al pool la conexión del hilo actual (fuera de peticiones)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        _local.conn = None
+        get_pool().release(conn)
+
+def reiniciar_pool():
+    """Descarta el pool y el escritor heredados del proceso padre tras un fork
+    
+    Una conexión SQLite no debe usarse desde dos procesos; no se cierran para
+    no tocar el estado que sigue usando el padre, solo se olvidan. El hilo
+    escritor no sobrevive al fork: el hijo arranca el suyo al escribir.
+    """
+    global _pool, _escritor, _local
+    _pool = None
+    _escritor = None
+    _local = threading.local()
+
+def calentar_pool(cantidad):
+    """Abre de antemano hasta `cantidad` conexiones con el esquema ya cargado"""
+    pool = get_pool()
+    conexiones = [pool.acquire() for _ in range(min(cantidad, pool.max_size))]
+    for conn in conexiones:
+        conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+    for conn in conexiones:
+        pool.release(conn)
+    return len(conexiones)
+
+def estadisticas_db():
+    """Métricas del escritor de este proceso y conexiones de lectura libres"""
+    return {
+        **get_escritor().estadisticas(),
+        'conexiones_lectura_libres': get_pool()._idle.qsize()
+    }
+
+def _escritor_no_disponible(error):
+    respuesta = jsonify({'error': 'Base de datos no disponible, inténtalo de nuevo'})
+    respuesta.headers['Retry-After'] = '1'
+    return respuesta, 503
+
+def init_app(app):
+    """Registra la liberación de conexiones al terminar cada petición
+    
+    Las escrituras que el escritor no confirma (EscritorNoDisponible) se
+    responden con 503.
+    """
+    app.teardown_appcontext(close_db)
+    app.register_error_handler(EscritorNoDisponible, _escritor_no_disponible)
+
 def init_db():
-    """Inicializa la base de datos con las tablas necesarias"""
-    conn = get_db_connection()
+    """Inicializa la base de datos con las tablas necesarias
+    
+    Usa una conexión de escritura propia: se ejecuta antes de servir
+    peticiones, sin el hilo escritor.
+    """
+    conn = conectar(DATABASE)
+    # Modo WAL: persistente en el archivo, lectores y escritor no se bloquean
+    conn.execute('PRAGMA journal_mode = WAL')
     cursor = conn.cursor()
     
     # Tabla Usuarios
@@ -91,6 +530,10 @@ def init_db():
         ''', ('Administrador', 'admin@proyectos.com', password_hash, 'Administrador'))
     
     conn.commit()
+    
+    # Índices y cambios de esquema versionados (PRAGMA user_version)
+    aplicar_migraciones(conn)
+    
     conn.close()
     print("Base de datos inicializada correctamente")
 
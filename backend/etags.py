@@ -0,0 +1,61 @@
+"""
+Respuestas condicionales (ETag / If-None-Match) basadas en versiones de datos
+
+Los triggers de la migración 7 incrementan versiones_datos en cada escritura
+sobre usuarios, proyectos o tareas. La ETag de una respuesta combina esas
+versiones con el usuario y la URL, así que puede compararse con If-None-Match
+y responder 304 sin ejecutar la consulta del listado.
+"""
+import hashlib
+from functools import wraps
+from flask import make_response, request
+
+from database import get_db_connection
+
+def obtener_versiones(ambitos):
+    """Obtiene la versión actual de cada ámbito (tabla) indicado"""
+    conn = get_db_connection()
+    marcadores = ', '.join('?' * len(ambitos))
+    cursor = conn.execute(f'''
+        SELECT ambito, version FROM versiones_datos
+        WHERE ambito IN ({marcadores})
+        ORDER BY ambito
+    ''', list(ambitos))
+    return [(row['ambito'], row['version']) for row in cursor.fetchall()]
+
+def calcular_etag(ambitos):
+    """ETag de la petición actual para los ámbitos dados
+    
+    Las tareas retrasadas no dependen de la fecha de la petición: el
+    planificador de vencimientos las marca y eso cambia la versión de tareas.
+    """
+    from auth import get_current_user
+    
+    user = get_current_user()
+    partes = [request.full_path, str(user['id']), user['rol']]
+    partes += [f'{ambito}:{version}' for ambito, version in obtener_versiones(ambitos)]
+    return hashlib.sha1('|'.join(partes).encode('utf-8')).hexdigest()[:20]
+
+def con_etag(*ambitos):
+    """Decorador: emite una ETag débil y responde 304 si el cliente ya la tiene
+    
+    Debe ir después de login_required.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            etag = calcular_etag(ambitos)
+            
+            if request.if_none_match.contains_weak(etag):
+                response = make_response('', 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            
+            response.set_etag(etag, weak=True)
+            # El navegador debe revalidar siempre, pero puede reutilizar su copia
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
@@ -0,0 +1,239 @@
+"""
+Publicación de eventos en el proceso y flujos Server-Sent Events
+
+Los modelos publican un evento después de cada escritura confirmada sobre
+tareas o proyectos. Cada conexión a /api/eventos tiene una suscripción con
+una cola acotada: publicar nunca bloquea, y si un cliente lento llena su cola
+se descartan sus eventos pendientes y recibe un evento 'resync' para que
+recargue los datos.
+"""
+import itertools
+import json
+import os
+import queue
+import sqlite3
+import threading
+
+from database import get_db_connection, release_thread_connection
+
+# Eventos pendientes por suscriptor antes de forzar un 'resync'
+EVENTOS_COLA_MAX = int(os.environ.get('EVENTOS_COLA_MAX', '256'))
+# Segundos entre heartbeats cuando no hay eventos
+EVENTOS_HEARTBEAT = float(os.environ.get('EVENTOS_HEARTBEAT', '15'))
+# Conexiones SSE simultáneas por proceso; bajo servidor.py se limita además
+# según los hilos del worker (limite_por_hilos)
+EVENTOS_MAX_SUSCRIPTORES = int(os.environ.get('EVENTOS_MAX_SUSCRIPTORES', '200'))
+# Hilos de cada worker que nunca se dedican a flujos SSE
+EVENTOS_HILOS_LIBRES = int(os.environ.get('EVENTOS_HILOS_LIBRES', '16'))
+# Milisegundos que espera el navegador antes de reconectar
+EVENTOS_REINTENTO_MS = 3000
+# Segundos entre lecturas de tareas_cambios del retransmisor (varios workers)
+EVENTOS_SONDEO = float(os.environ.get('EVENTOS_SONDEO', '1'))
+
+class HubLleno(Exception):
+    """Se alcanzó el máximo de suscriptores del proceso"""
+
+class Suscripcion:
+    """Cola de eventos de un cliente SSE"""
+    
+    def __init__(self, max_cola=EVENTOS_COLA_MAX):
+        self.cola = queue.Queue(maxsize=max_cola)
+        self.desbordada = False
+    
+    def entregar(self, evento):
+        """Encola un evento sin bloquear; si no cabe, marca la suscripción"""
+        if self.desbordada:
+            return
+        try:
+            self.cola.put_nowait(evento)
+        except queue.Full:
+            self.desbordada = True
+    
+    def vaciar(self):
+        """Descarta los eventos pendientes tras un desbordamiento"""
+        while True:
+            try:
+                self.cola.get_nowait()
+            except queue.Empty:
+                break
+        self.desbordada = False
+
+class HubEventos:
+    """Reparte cada evento publicado a todas las suscripciones del proceso"""
+    
+    def __init__(self, max_suscriptores=EVENTOS_MAX_SUSCRIPTORES):
+        self.max_suscriptores = max_suscriptores
+        self._suscripciones = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.publicados = 0
+        self.desbordamientos = 0
+    
+    def suscribir(self):
+        """Crea una suscripción; lanza HubLleno si se alcanzó el máximo"""
+        with self._lock:
+            if len(self._suscripciones) >= self.max_suscriptores:
+                raise HubLleno()
+            suscripcion = Suscripcion()
+            self._suscripciones.add(suscripcion)
+        return suscripcion
+    
+    def cancelar(self, suscripcion):
+        """Elimina una suscripción (el cliente se desconectó)"""
+        with self._lock:
+            self._suscripciones.discard(suscripcion)
+    
+    def publicar(self, tipo, accion, proyecto_id, datos):
+        """Publica un evento; el filtrado por permisos lo hace cada suscriptor"""
+        with self._lock:
+            evento = {
+                'id': next(self._ids),
+                'tipo': tipo,
+                'accion': accion,
+                'proyecto_id': proyecto_id,
+                'datos': datos
+            }
+            self.publicados += 1
+            suscripciones = list(self._suscripciones)
+        
+        for suscripcion in suscripciones:
+            ya_desbordada = suscripcion.desbordada
+            suscripcion.entregar(evento)
+            if suscripcion.desbordada and not ya_desbordada:
+                with self._lock:
+                    self.desbordamientos += 1
+    
+    def estadisticas(self):
+        """Suscriptores activos, eventos publicados y desbordamientos"""
+        with self._lock:
+            return {
+                'suscriptores': len(self._suscripciones),
+                'publicados': self.publicados,
+                'desbordamientos': self.desbordamientos
+            }
+
+hub = HubEventos()
+
+def limite_por_hilos(hilos):
+    """Suscriptores que admite un worker gthread con `hilos` hilos
+    
+    Cada flujo SSE ocupa un hilo del worker mientras está abierto, así que se
+    dejan EVENTOS_HILOS_LIBRES hilos (o la mitad, con pocos hilos) para las
+    demás peticiones.
+    """
+    return max(1, min(EVENTOS_MAX_SUSCRIPTORES, max(hilos // 2, hilos - EVENTOS_HILOS_LIBRES)))
+
+def respuesta_lleno():
+    """Cuerpo y cabeceras del 503 cuando no caben más suscriptores"""
+    return (f'retry: {EVENTOS_REINTENTO_MS}\n\n',
+            {'Retry-After': str(EVENTOS_REINTENTO_MS // 1000), 'Cache-Control': 'no-cache'})
+
+def formatear(evento):
+    """Serializa un evento en formato text/event-stream"""
+    datos = json.dumps(evento, default=str)
+    return f"id: {evento['id']}\nevent: {evento['tipo']}\ndata: {datos}\n\n"
+
+def flujo_sse(suscripcion, puede_ver, heartbeat=EVENTOS_HEARTBEAT):
+    """Generador del cuerpo de la respuesta SSE para una suscripción"""
+    try:
+        # Reintento del navegador tras una desconexión, en milisegundos
+        yield f'retry: {EVENTOS_REINTENTO_MS}\n\n'
+        
+        while True:
+            if suscripcion.desbordada:
+                suscripcion.vaciar()
+                yield 'event: resync\ndata: {}\n\n'
+                continue
+            
+            try:
+                evento = suscripcion.cola.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ': heartbeat\n\n'
+                continue
+            
+            if puede_ver(evento):
+                yield formatear(evento)
+    finally:
+        hub.cancelar(suscripcion)
+
+class Retransmisor(threading.Thread):
+    """Publica en el hub del proceso los cambios hechos por otros procesos
+    
+    Con varios workers cada uno tiene su propio hub. Este hilo lee los
+    registros tareas_cambios y proyectos_cambios y publica, por proyecto, un
+    evento 'tareas' o 'proyecto' con acción 'sincronizar'. Los cambios del
+    propio proceso también pasan por aquí; como los clientes responden
+    sincronizando o recargando, repetir el aviso es inocuo.
+    """
+    
+    def __init__(self, intervalo=EVENTOS_SONDEO):
+        super().__init__(name='retransmisor-eventos', daemon=True)
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+    
+    def _ultimo_seq(self, tabla):
+        row = get_db_connection().execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = ?", (tabla,)
+        ).fetchone()
+        return row[0] if row else 0
+    
+    def _retransmitir(self, ultimo):
+        """Publica los cambios de tareas posteriores a ultimo y devuelve el nuevo último seq"""
+        filas = get_db_connection().execute('''
+            SELECT seq, tarea_id, proyecto_id, asignado_a_id, asignado_anterior_id
+            FROM tareas_cambios
+            WHERE seq > ?
+            ORDER BY seq
+            LIMIT 1000
+        ''', (ultimo,)).fetchall()
+        if not filas:
+            return ultimo
+        
+        por_proyecto = {}
+        for fila in filas:
+            por_proyecto.setdefault(fila['proyecto_id'], []).append({
+                'id': fila['tarea_id'],
+                'proyecto_id': fila['proyecto_id'],
+                'asignado_a_id': fila['asignado_a_id'],
+                'asignado_anterior_id': fila['asignado_anterior_id']
+            })
+        for proyecto_id, tareas in por_proyecto.items():
+            hub.publicar('tareas', 'sincronizar', proyecto_id, tareas)
+        return filas[-1]['seq']
+    
+    def _retransmitir_proyectos(self, ultimo):
+        """Publica los cambios de proyectos posteriores a ultimo y devuelve el nuevo último seq"""
+        filas = get_db_connection().execute('''
+            SELECT seq, proyecto_id
+            FROM proyectos_cambios
+            WHERE seq > ?
+            ORDER BY seq
+            LIMIT 1000
+        ''', (ultimo,)).fetchall()
+        if not filas:
+            return ultimo
+        
+        for proyecto_id in dict.fromkeys(fila['proyecto_id'] for fila in filas):
+            hub.publicar('proyecto', 'sincronizar', proyecto_id, {'id': proyecto_id})
+        return filas[-1]['seq']
+    
+    def run(self):
+        try:
+            ultimo = self._ultimo_seq('tareas_cambios')
+            ultimo_proyectos = self._ultimo_seq('proyectos_cambios')
+        finally:
+            release_thread_connection()
+        
+        while not self._parar.wait(self.intervalo):
+            try:
+                ultimo = self._retransmitir(ultimo)
+                ultimo_proyectos = self._retransmitir_proyectos(ultimo_proyectos)
+            except sqlite3.Error:
+                # Base de datos ocupada o bloqueada: se reintenta en la siguiente vuelta
+                pass
+            finally:
+                release_thread_connection()
+    
+    def parar(self):
+        """Detiene el hilo tras la espera en curso"""
+        self._parar.set()
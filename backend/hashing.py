@@ -0,0 +1,95 @@
+"""
+Hash de contraseñas en un pool de procesos
+
+Calcular o verificar un hash (scrypt o pbkdf2) ocupa la CPU decenas de
+milisegundos y retiene el GIL, así que hecho en el hilo de la petición frena
+a todas las demás peticiones del worker. Aquí se hace en procesos aparte: el
+hilo que espera el resultado suelta el GIL y los demás siguen atendiendo.
+
+El método se configura con HASH_METODO en el formato de werkzeug, p. ej.
+'scrypt:32768:8:1' o 'pbkdf2:sha256:600000'. Los hashes guardados con otro
+método siguen siendo válidos y se rehacen al iniciar sesión (necesita_rehash).
+"""
+import functools
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import check_password_hash, generate_password_hash
+
+HASH_METODO = os.environ.get('HASH_METODO', 'scrypt:32768:8:1')
+# Procesos del pool por worker; 0 calcula los hashes en el propio hilo
+HASH_PROCESOS = int(os.environ.get('HASH_PROCESOS', str(min(os.cpu_count() or 1, 4))))
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def _get_pool(roto=None):
+    """Pool del proceso actual; se crea al primer uso (también tras un fork)
+    
+    Si `roto` sigue siendo el pool actual, lo sustituye por uno nuevo. Varios
+    hilos pueden encontrarlo roto a la vez: solo el primero lo rehace.
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid() or _pool is roto:
+            if _pool is not None and _pool is roto:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = ProcessPoolExecutor(max_workers=HASH_PROCESOS)
+            _pool_pid = os.getpid()
+        return _pool
+
+def iniciar():
+    """Arranca los procesos del pool antes de la primera petición"""
+    if HASH_PROCESOS > 0:
+        _en_pool(lambda pool: list(pool.map(len, [''] * HASH_PROCESOS)))
+
+def _en_pool(operacion):
+    """Ejecuta operacion(pool), rehaciendo el pool una vez si está roto
+    
+    Un proceso del pool que muere (p. ej. por falta de memoria) deja el pool
+    inservible: todas las llamadas siguientes fallarían con BrokenProcessPool.
+    """
+    pool = _get_pool()
+    try:
+        return operacion(pool)
+    except BrokenProcessPool:
+        return operacion(_get_pool(roto=pool))
+
+def _ejecutar(fn, *args):
+    if HASH_PROCESOS <= 0:
+        return fn(*args)
+    return _en_pool(lambda pool: pool.submit(fn, *args).result())
+
+def generar(password):
+    """Hash de una contraseña con el método configurado"""
+    return _ejecutar(generate_password_hash, password, HASH_METODO)
+
+def generar_varios(passwords):
+    """Hashes de varias contraseñas, calculados en paralelo"""
+    if HASH_PROCESOS <= 0:
+        return [generate_password_hash(password, HASH_METODO) for password in passwords]
+    return _en_pool(lambda pool: list(pool.map(generate_password_hash, passwords,
+                                               [HASH_METODO] * len(passwords))))
+
+def verificar(password_hash, password):
+    """Comprueba una contraseña contra su hash"""
+    return _ejecutar(check_password_hash, password_hash, password)
+
+@functools.cache
+def _metodo_guardado():
+    """Método tal como queda en el hash ('pbkdf2' -> 'pbkdf2:sha256:600000')"""
+    return generate_password_hash('', HASH_METODO).split('$', 1)[0]
+
+def necesita_rehash(password_hash):
+    """Indica si el hash se generó con un método distinto del configurado"""
+    return password_hash.split('$', 1)[0] != _metodo_guardado()
+
+def cerrar():
+    """Termina los procesos del pool (p. ej. al apagar el worker)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,354 @@
+"""
+Migraciones versionadas del esquema de la base de datos
+
+La versión aplicada se guarda en PRAGMA user_version, de modo que un
+proyectos.db existente se actualiza en el lugar al ejecutar init_db().
+Cada migración se aplica en su propia transacción; para cambiar el esquema
+se añade una nueva entrada al final de MIGRACIONES, nunca se edita una ya
+publicada.
+"""
+
+# (versión, descripción, sentencias)
+MIGRACIONES = [
+    (1, 'Índices compuestos sobre tareas', [
+        # Progreso y métricas por proyecto: WHERE proyecto_id = ? [AND estado = ?]
+        'CREATE INDEX IF NOT EXISTS idx_tareas_proyecto_estado '
+        'ON tareas(proyecto_id, estado)',
+        # Listado por proyecto: WHERE proyecto_id = ? ORDER BY fecha_creacion
+        'CREATE INDEX IF NOT EXISTS idx_tareas_proyecto_creacion '
+        'ON tareas(proyecto_id, fecha_creacion)',
+        # Tareas y métricas por usuario, incluidas las retrasadas
+        'CREATE INDEX IF NOT EXISTS idx_tareas_asignado_estado_limite '
+        'ON tareas(asignado_a_id, estado, fecha_limite)',
+        # Filtro por estado ordenado por fecha límite y tareas retrasadas globales
+        'CREATE INDEX IF NOT EXISTS idx_tareas_estado_limite '
+        'ON tareas(estado, fecha_limite)',
+    ]),
+    (2, 'Índices de listado de proyectos', [
+        # Proyectos de un gestor ordenados por fecha de creación
+        'CREATE INDEX IF NOT EXISTS idx_proyectos_responsable_creacion '
+        'ON proyectos(responsable_id, fecha_creacion)',
+        # Listado completo del administrador
+        'CREATE INDEX IF NOT EXISTS idx_proyectos_creacion '
+        'ON proyectos(fecha_creacion)',
+        'ANALYZE',
+    ]),
+    (3, 'Contadores de tareas mantenidos por triggers', [
+        # Una fila por (proyecto, asignado, estado); asignado_a_id = 0 si no hay
+        # asignado, porque una clave con NULL no permitiría el UPSERT
+        '''CREATE TABLE IF NOT EXISTS tareas_contadores (
+            proyecto_id INTEGER NOT NULL,
+            asignado_a_id INTEGER NOT NULL DEFAULT 0,
+            estado TEXT NOT NULL,
+            cantidad INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (proyecto_id, asignado_a_id, estado)
+        ) WITHOUT ROWID''',
+        'CREATE INDEX IF NOT EXISTS idx_tareas_contadores_asignado '
+        'ON tareas_contadores(asignado_a_id, estado)',
+        '''INSERT INTO tareas_contadores (proyecto_id, asignado_a_id, estado, cantidad)
+           SELECT proyecto_id, COALESCE(asignado_a_id, 0), estado, COUNT(*)
+           FROM tareas
+           GROUP BY proyecto_id, COALESCE(asignado_a_id, 0), estado''',
+        '''CREATE TRIGGER IF NOT EXISTS tareas_contadores_insert
+           AFTER INSERT ON tareas
+           BEGIN
+               INSERT INTO tareas_contadores (proyecto_id, asignado_a_id, estado, cantidad)
+               VALUES (NEW.proyecto_id, COALESCE(NEW.asignado_a_id, 0), NEW.estado, 1)
+               ON CONFLICT (proyecto_id, asignado_a_id, estado)
+               DO UPDATE SET cantidad = cantidad + 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS tareas_contadores_delete
+           AFTER DELETE ON tareas
+           BEGIN
+               UPDATE tareas_contadores SET cantidad = cantidad - 1
+               WHERE proyecto_id = OLD.proyecto_id
+                 AND asignado_a_id = COALESCE(OLD.asignado_a_id, 0)
+                 AND estado = OLD.estado;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS tareas_contadores_update
+           AFTER UPDATE OF proyecto_id, asignado_a_id, estado ON tareas
+           WHEN OLD.proyecto_id IS NOT NEW.proyecto_id
+             OR OLD.asignado_a_id IS NOT NEW.asignado_a_id
+             OR OLD.estado IS NOT NEW.estado
+           BEGIN
+               UPDATE tareas_contadores SET cantidad = cantidad - 1
+               WHERE proyecto_id = OLD.proyecto_id
+                 AND asignado_a_id = COALESCE(OLD.asignado_a_id, 0)
+                 AND estado = OLD.estado;
+               INSERT INTO tareas_contadores (proyecto_id, asignado_a_id, estado, cantidad)
+               VALUES (NEW.proyecto_id, COALESCE(NEW.asignado_a_id, 0), NEW.estado, 1)
+               ON CONFLICT (proyecto_id, asignado_a_id, estado)
+               DO UPDATE SET cantidad = cantidad + 1;
+           END''',
+        # Las retrasadas dependen de la fecha actual y no caben en los contadores:
+        # este índice las resuelve por proyecto con búsquedas por rango
+        'DROP INDEX IF EXISTS idx_tareas_proyecto_estado',
+        'CREATE INDEX IF NOT EXISTS idx_tareas_proyecto_estado_limite '
+        'ON tareas(proyecto_id, estado, fecha_limite)',
+    ]),
+    (4, 'Índice de la caché de reportes', [
+        'CREATE INDEX IF NOT EXISTS idx_reportes_clave '
+        'ON reportes(tipo, proyecto_id, usuario_id)',
+    ]),
+    (5, 'Índice de pertenencia de colaboradores a proyectos', [
+        # Permisos de colaborador: EXISTS (tareas WHERE asignado_a_id = ? AND proyecto_id = ?)
+        'CREATE INDEX IF NOT EXISTS idx_tareas_asignado_proyecto '
+        'ON tareas(asignado_a_id, proyecto_id)',
+    ]),
+    (6, 'Versión de fila en tareas para control de concurrencia optimista', [
+        'ALTER TABLE tareas ADD COLUMN version INTEGER NOT NULL DEFAULT 0',
+    ]),
+    (7, 'Contador de cambios por tabla para respuestas condicionales (ETag)', [
+        '''CREATE TABLE IF NOT EXISTS versiones_datos (
+            ambito TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID''',
+        "INSERT OR IGNORE INTO versiones_datos (ambito) VALUES ('usuarios'), ('proyectos'), ('tareas')",
+        '''CREATE TRIGGER IF NOT EXISTS versiones_usuarios_insert
+           AFTER INSERT ON usuarios
+           BEGIN
+               UPDATE versiones_datos SET version = version + 1 WHERE ambito = 'usuarios';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS versiones_usuarios_update
+           AFTER UPDATE ON usuarios
+           BEGIN
+               UPDATE versiones_datos SET version = version + 1 WHERE ambito = 'usuarios';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS versiones_usuarios_delete
+           AFTER DELETE ON usuarios
+           BEGIN
+               UPDATE versiones_datos SET version = version + 1 WHERE ambito = 'usuarios';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS versiones_proyectos_insert
+           AFTER INSERT ON proyectos
+           BEGIN
+               UPDATE versiones_datos SET version = version + 1 WHERE ambito = 'proyectos';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS versiones_proyectos_update
+           AFTER UPDATE ON proyectos
+           BEGIN
+               UPDATE versiones_datos SET version = version + 1 WHERE ambito = 'proyectos';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS versiones_proyectos_delete
+           AFTER DELETE ON proyectos
+           BEGIN
+               UPDATE versiones_datos SET version = version + 1 WHERE ambito = 'proyectos';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS versiones_tareas_insert
+           AFTER INSERT ON tareas
+           BEGIN
+               UPDATE versiones_datos SET version = version + 1 WHERE ambito = 'tareas';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS versiones_tareas_update
+           AFTER UPDATE ON tareas
+           BEGIN
+               UPDATE versiones_datos SET version = version + 1 WHERE ambito = 'tareas';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS versiones_tareas_delete
+           AFTER DELETE ON tareas
+           BEGIN
+               UPDATE versiones_datos SET version = version + 1 WHERE ambito = 'tareas';
+           END''',
+    ]),
+    (8, 'Registro de cambios de tareas para sincronización incremental', [
+        # seq es el cursor monotónico del feed; las bajas quedan como lápidas
+        '''CREATE TABLE IF NOT EXISTS tareas_cambios (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tarea_id INTEGER NOT NULL,
+            proyecto_id INTEGER,
+            asignado_a_id INTEGER,
+            asignado_anterior_id INTEGER,
+            operacion TEXT NOT NULL CHECK(operacion IN ('alta', 'modificacion', 'baja')),
+            fecha DATETIME DEFAULT CURRENT_TIMESTAMP
+        )''',
+        # Último seq purgado: un cursor anterior ya no puede sincronizarse
+        "INSERT OR IGNORE INTO versiones_datos (ambito, version) VALUES ('tareas_cambios_purgado', 0)",
+        '''CREATE TRIGGER IF NOT EXISTS tareas_cambios_insert
+           AFTER INSERT ON tareas
+           BEGIN
+               INSERT INTO tareas_cambios (tarea_id, proyecto_id, asignado_a_id, operacion)
+               VALUES (NEW.id, NEW.proyecto_id, NEW.asignado_a_id, 'alta');
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS tareas_cambios_update
+           AFTER UPDATE ON tareas
+           BEGIN
+               INSERT INTO tareas_cambios (tarea_id, proyecto_id, asignado_a_id, asignado_anterior_id, operacion)
+               VALUES (NEW.id, NEW.proyecto_id, NEW.asignado_a_id, OLD.asignado_a_id, 'modificacion');
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS tareas_cambios_delete
+           AFTER DELETE ON tareas
+           BEGIN
+               INSERT INTO tareas_cambios (tarea_id, proyecto_id, asignado_anterior_id, operacion)
+               VALUES (OLD.id, OLD.proyecto_id, OLD.asignado_a_id, 'baja');
+           END''',
+    ]),
+    (9, 'Época de sesión por usuario para revocar sesiones y tokens', [
+        # Las sesiones y tokens firmados llevan la época con la que se emitieron
+        'ALTER TABLE usuarios ADD COLUMN epoca_sesion INTEGER NOT NULL DEFAULT 0',
+        # Un cambio de rol invalida las credenciales que llevan el rol anterior
+        '''CREATE TRIGGER IF NOT EXISTS usuarios_rol_epoca
+           AFTER UPDATE OF rol ON usuarios
+           WHEN NEW.rol IS NOT OLD.rol
+           BEGIN
+               UPDATE usuarios SET epoca_sesion = epoca_sesion + 1 WHERE id = NEW.id;
+           END''',
+    ]),
+    (10, 'Índices de texto completo (FTS5) de tareas y proyectos', [
+        # Contenido externo: el índice guarda solo los términos, el texto sigue en la
+        # tabla; prefix indexa los prefijos de 2 y 3 letras para búsquedas 'dis*'
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS tareas_fts USING fts5(
+            titulo, descripcion,
+            content='tareas', content_rowid='id',
+            prefix='2 3', tokenize='unicode61 remove_diacritics 2'
+        )''',
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS proyectos_fts USING fts5(
+            nombre, descripcion,
+            content='proyectos', content_rowid='id',
+            prefix='2 3', tokenize='unicode61 remove_diacritics 2'
+        )''',
+        # Orden por relevancia (rank): una coincidencia en el título pesa más
+        "INSERT INTO tareas_fts (tareas_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+        "INSERT INTO proyectos_fts (proyectos_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+        "INSERT INTO tareas_fts (tareas_fts) VALUES ('rebuild')",
+        "INSERT INTO proyectos_fts (proyectos_fts) VALUES ('rebuild')",
+        '''CREATE TRIGGER IF NOT EXISTS tareas_fts_insert
+           AFTER INSERT ON tareas
+           BEGIN
+               INSERT INTO tareas_fts (rowid, titulo, descripcion)
+               VALUES (NEW.id, NEW.titulo, NEW.descripcion);
+           END''',
+        # Solo si cambia el texto: los cambios de estado no tocan el índice
+        '''CREATE TRIGGER IF NOT EXISTS tareas_fts_update
+           AFTER UPDATE OF titulo, descripcion ON tareas
+           BEGIN
+               INSERT INTO tareas_fts (tareas_fts, rowid, titulo, descripcion)
+               VALUES ('delete', OLD.id, OLD.titulo, OLD.descripcion);
+               INSERT INTO tareas_fts (rowid, titulo, descripcion)
+               VALUES (NEW.id, NEW.titulo, NEW.descripcion);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS tareas_fts_delete
+           AFTER DELETE ON tareas
+           BEGIN
+               INSERT INTO tareas_fts (tareas_fts, rowid, titulo, descripcion)
+               VALUES ('delete', OLD.id, OLD.titulo, OLD.descripcion);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS proyectos_fts_insert
+           AFTER INSERT ON proyectos
+           BEGIN
+               INSERT INTO proyectos_fts (rowid, nombre, descripcion)
+               VALUES (NEW.id, NEW.nombre, NEW.descripcion);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS proyectos_fts_update
+           AFTER UPDATE OF nombre, descripcion ON proyectos
+           BEGIN
+               INSERT INTO proyectos_fts (proyectos_fts, rowid, nombre, descripcion)
+               VALUES ('delete', OLD.id, OLD.nombre, OLD.descripcion);
+               INSERT INTO proyectos_fts (rowid, nombre, descripcion)
+               VALUES (NEW.id, NEW.nombre, NEW.descripcion);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS proyectos_fts_delete
+           AFTER DELETE ON proyectos
+           BEGIN
+               INSERT INTO proyectos_fts (proyectos_fts, rowid, nombre, descripcion)
+               VALUES ('delete', OLD.id, OLD.nombre, OLD.descripcion);
+           END''',
+    ]),
+    (11, 'Marca persistente de tareas retrasadas', [
+        # 1 si la tarea está abierta y su fecha límite ya pasó (fecha UTC, como date('now')).
+        # Los triggers la fijan al escribir la tarea; el paso del tiempo lo aplica
+        # el planificador de vencimientos.py
+        'ALTER TABLE tareas ADD COLUMN retrasada INTEGER NOT NULL DEFAULT 0',
+        '''UPDATE tareas SET retrasada = 1
+           WHERE estado != 'Finalizado' AND fecha_limite IS NOT NULL AND fecha_limite < date('now')''',
+        # Tareas abiertas por fecha límite: próximos vencimientos y barrido del planificador
+        'CREATE INDEX IF NOT EXISTS idx_tareas_abiertas_limite '
+        "ON tareas(fecha_limite) WHERE estado != 'Finalizado' AND fecha_limite IS NOT NULL",
+        # Conteos de retrasadas (globales, por proyecto o por asignado) sobre un índice pequeño
+        'CREATE INDEX IF NOT EXISTS idx_tareas_retrasadas '
+        'ON tareas(proyecto_id, asignado_a_id) WHERE retrasada = 1',
+        '''CREATE TRIGGER IF NOT EXISTS tareas_retrasada_insert
+           AFTER INSERT ON tareas
+           WHEN NEW.estado != 'Finalizado' AND NEW.fecha_limite < date('now')
+           BEGIN
+               UPDATE tareas SET retrasada = 1 WHERE id = NEW.id;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS tareas_retrasada_update
+           AFTER UPDATE OF estado, fecha_limite ON tareas
+           WHEN NEW.retrasada IS NOT (NEW.estado != 'Finalizado' AND NEW.fecha_limite IS NOT NULL
+                                      AND NEW.fecha_limite < date('now'))
+           BEGIN
+               UPDATE tareas
+               SET retrasada = (NEW.estado != 'Finalizado' AND NEW.fecha_limite IS NOT NULL
+                                AND NEW.fecha_limite < date('now'))
+               WHERE id = NEW.id;
+           END''',
+    ]),
+    (12, 'Índice de paginación de tareas por fecha de creación', [
+        # Listado del administrador: ORDER BY fecha_creacion DESC, id DESC con cursor
+        'CREATE INDEX IF NOT EXISTS idx_tareas_fecha_creacion '
+        'ON tareas(fecha_creacion, id)',
+    ]),
+    (13, 'Registro de cambios de proyectos para retransmitir eventos entre workers', [
+        '''CREATE TABLE IF NOT EXISTS proyectos_cambios (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            proyecto_id INTEGER NOT NULL,
+            operacion TEXT NOT NULL CHECK(operacion IN ('alta', 'modificacion', 'baja')),
+            fecha DATETIME DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TRIGGER IF NOT EXISTS proyectos_cambios_insert
+           AFTER INSERT ON proyectos
+           BEGIN
+               INSERT INTO proyectos_cambios (proyecto_id, operacion) VALUES (NEW.id, 'alta');
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS proyectos_cambios_update
+           AFTER UPDATE ON proyectos
+           BEGIN
+               INSERT INTO proyectos_cambios (proyecto_id, operacion) VALUES (NEW.id, 'modificacion');
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS proyectos_cambios_delete
+           AFTER DELETE ON proyectos
+           BEGIN
+               INSERT INTO proyectos_cambios (proyecto_id, operacion) VALUES (OLD.id, 'baja');
+           END''',
+    ]),
+]
+
+def obtener_version(conn):
+    """Obtiene la versión de esquema registrada en la base de datos"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def aplicar_migraciones(conn):
+    """Aplica en orden las migraciones pendientes y devuelve las aplicadas"""
+    if conn.in_transaction:
+        conn.commit()
+    
+    version_actual = obtener_version(conn)
+    aplicadas = []
+    
+    for version, descripcion, sentencias in MIGRACIONES:
+        if version <= version_actual:
+            continue
+        
+        try:
+            conn.execute('BEGIN')
+            for sentencia in sentencias:
+                conn.execute(sentencia)
+            # PRAGMA no admite parámetros; la versión es siempre un entero propio
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        
+        aplicadas.append((version, descripcion))
+    
+    return aplicadas
+
+if __name__ == '__main__':
+    from database import DATABASE, conectar
+    
+    conn = conectar(DATABASE)
+    for version, descripcion in aplicar_migraciones(conn):
+        print(f"✓ Migración {version}: {descripcion}")
+    print(f"Versión del esquema: {obtener_version(conn)}")
+    conn.close()
@@ -1,33 +1,89 @@
 """
 Modelos de datos del sistema
 """
+import html
+import re
 import sqlite3
-from database import get_db_connection
-from werkzeug.security import check_password_hash, generate_password_hash
-from datetime import datetime, date
+import hashing
+from database import Deshacer, ejecutar_escritura, get_db_connection, registrar_cursor
+from cache import cache_reportes
+from eventos import hub
+import vencimientos
+
+def _filas(cursor, en_flujo=False):
+    """Filas de un cursor como diccionarios
+    
+    Con en_flujo devuelve un generador que recorre el cursor sin cargar
+    todas las filas en memoria (ver respuestas.json_en_flujo).
+    """
+    if en_flujo:
+        registrar_cursor(cursor)
+        return (dict(row) for row in cursor)
+    return [dict(row) for row in cursor.fetchall()]
 
 class Usuario:
     """Modelo de Usuario"""
     
+    # Se incrementa con cada cambio en usuarios; invalida cachés de identidad
+    version = 0
+    
     @staticmethod
     def crear(nombre, email, password, rol='Colaborador'):
         """Crea un nuevo usuario"""
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        # El hash se calcula en el pool de hashing, no en el escritor
+        password_hash = hashing.generar(password)
         
-        try:
-            password_hash = generate_password_hash(password)
-            cursor.execute('''
+        def escribir(conn):
+            cursor = conn.execute('''
                 INSERT INTO usuarios (nombre, email, password_hash, rol)
                 VALUES (?, ?, ?, ?)
+                RETURNING id
             ''', (nombre, email, password_hash, rol))
-            conn.commit()
-            user_id = cursor.lastrowid
-            return {'id': user_id, 'nombre': nombre, 'email': email, 'rol': rol}
+            return cursor.fetchone()['id']
+        
+        try:
+            user_id = ejecutar_escritura(escribir)
         except sqlite3.IntegrityError:
             return None
-        finally:
-            conn.close()
+        
+        Usuario.version += 1
+        return {'id': user_id, 'nombre': nombre, 'email': email, 'rol': rol}
+    
+    @staticmethod
+    def crear_varios(usuarios):
+        """Crea varios usuarios en una única transacción
+        
+        Cada elemento es un diccionario con nombre, email, password y rol.
+        Los hashes se calculan en paralelo. Devuelve los usuarios creados, en
+        el mismo orden, o None si algún email ya estaba registrado.
+        """
+        hashes = hashing.generar_varios([u['password'] for u in usuarios])
+        filas = [(u['nombre'], u['email'], password_hash, u.get('rol', 'Colaborador'))
+                 for u, password_hash in zip(usuarios, hashes)]
+        
+        def escribir(conn):
+            return [conn.execute('''
+                INSERT INTO usuarios (nombre, email, password_hash, rol)
+                VALUES (?, ?, ?, ?)
+                RETURNING id
+            ''', fila).fetchone()['id'] for fila in filas]
+        
+        try:
+            ids = ejecutar_escritura(escribir)
+        except sqlite3.IntegrityError:
+            return None
+        
+        Usuario.version += 1
+        return [{'id': user_id, 'nombre': fila[0], 'email': fila[1], 'rol': fila[3]}
+                for user_id, fila in zip(ids, filas)]
+    
+    @staticmethod
+    def emails_registrados(emails):
+        """Subconjunto de emails que ya pertenecen a algún usuario"""
+        conn = get_db_connection()
+        marcadores = ','.join('?' * len(emails))
+        cursor = conn.execute(f'SELECT email FROM usuarios WHERE email IN ({marcadores})', list(emails))
+        return {row['email'] for row in cursor.fetchall()}
     
     @staticmethod
     def obtener_por_email(email):
@@ -36,7 +92,6 @@ class Usuario:
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM usuarios WHERE email = ?', (email,))
         user = cursor.fetchone()
-        conn.close()
         return dict(user) if user else None
     
     @staticmethod
@@ -46,13 +101,63 @@ class Usuario:
         cursor = conn.cursor()
         cursor.execute('SELECT id, nombre, email, rol FROM usuarios WHERE id = ?', (user_id,))
         user = cursor.fetchone()
-        conn.close()
         return dict(user) if user else None
     
     @staticmethod
     def verificar_password(user, password):
-        """Verifica la contraseña de un usuario"""
-        return check_password_hash(user['password_hash'], password)
+        """Verifica la contraseña de un usuario
+        
+        Si es correcta y su hash usa un método distinto de HASH_METODO, lo
+        rehace con el método actual (solo se conoce la contraseña al entrar).
+        """
+        if not hashing.verificar(user['password_hash'], password):
+            return False
+        
+        if hashing.necesita_rehash(user['password_hash']):
+            Usuario.actualizar_password_hash(user['id'], user['password_hash'],
+                                             hashing.generar(password))
+        return True
+    
+    @staticmethod
+    def actualizar_password_hash(user_id, anterior, nuevo):
+        """Sustituye el hash si no ha cambiado entretanto (p. ej. otro login)"""
+        def escribir(conn):
+            conn.execute('UPDATE usuarios SET password_hash = ? WHERE id = ? AND password_hash = ?',
+                         (nuevo, user_id, anterior))
+        
+        ejecutar_escritura(escribir)
+    
+    @staticmethod
+    def version_datos():
+        """Versión de la tabla usuarios (versiones_datos), común a todos los procesos"""
+        conn = get_db_connection()
+        row = conn.execute("SELECT version FROM versiones_datos WHERE ambito = 'usuarios'").fetchone()
+        return row['version'] if row else 0
+    
+    @staticmethod
+    def obtener_epocas():
+        """Época de sesión de cada usuario: {id: epoca_sesion}"""
+        conn = get_db_connection()
+        cursor = conn.execute('SELECT id, epoca_sesion FROM usuarios')
+        return {row['id']: row['epoca_sesion'] for row in cursor.fetchall()}
+    
+    @staticmethod
+    def revocar_sesiones(user_id):
+        """Invalida todas las sesiones y tokens emitidos hasta ahora para un usuario
+        
+        Devuelve la nueva época, o None si el usuario no existe.
+        """
+        def escribir(conn):
+            row = conn.execute('''
+                UPDATE usuarios SET epoca_sesion = epoca_sesion + 1
+                WHERE id = ?
+                RETURNING epoca_sesion
+            ''', (user_id,)).fetchone()
+            return row['epoca_sesion'] if row else None
+        
+        epoca = ejecutar_escritura(escribir)
+        Usuario.version += 1
+        return epoca
     
     @staticmethod
     def obtener_todos():
@@ -61,87 +166,129 @@ class Usuario:
         cursor = conn.cursor()
         cursor.execute('SELECT id, nombre, email, rol FROM usuarios ORDER BY nombre')
         users = cursor.fetchall()
-        conn.close()
         return [dict(user) for user in users]
 
 class Proyecto:
     """Modelo de Proyecto"""
     
+    # Proyecto con el nombre de su responsable
+    SELECT_DETALLE = '''
+        SELECT p.*, u.nombre as responsable_nombre
+        FROM proyectos p
+        JOIN usuarios u ON p.responsable_id = u.id
+        WHERE p.id = ?
+    '''
+    
+    @staticmethod
+    def _leer(cursor, proyecto_id):
+        """Lee un proyecto con sus joins sobre el cursor (y transacción) dado"""
+        cursor.execute(Proyecto.SELECT_DETALLE, (proyecto_id,))
+        proyecto = cursor.fetchone()
+        return dict(proyecto) if proyecto else None
+    
     @staticmethod
     def crear(nombre, descripcion, responsable_id, fecha_inicio, fecha_fin):
         """Crea un nuevo proyecto"""
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO proyectos (nombre, descripcion, responsable_id, fecha_inicio, fecha_fin)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (nombre, descripcion, responsable_id, fecha_inicio, fecha_fin))
+        def escribir(conn):
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO proyectos (nombre, descripcion, responsable_id, fecha_inicio, fecha_fin)
+                VALUES (?, ?, ?, ?, ?)
+                RETURNING id
+            ''', (nombre, descripcion, responsable_id, fecha_inicio, fecha_fin))
+            proyecto_id = cursor.fetchone()['id']
+            
+            return Proyecto._leer(cursor, proyecto_id)
         
-        conn.commit()
-        proyecto_id = cursor.lastrowid
-        conn.close()
+        proyecto = ejecutar_escritura(escribir)
         
-        return Proyecto.obtener_por_id(proyecto_id)
+        hub.publicar('proyecto', 'creado', proyecto['id'], proyecto)
+        return proyecto
     
     @staticmethod
     def obtener_por_id(proyecto_id):
         """Obtiene un proyecto por su ID"""
         conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT p.*, u.nombre as responsable_nombre
-            FROM proyectos p
-            JOIN usuarios u ON p.responsable_id = u.id
-            WHERE p.id = ?
-        ''', (proyecto_id,))
-        proyecto = cursor.fetchone()
-        conn.close()
-        return dict(proyecto) if proyecto else None
+        return Proyecto._leer(conn.cursor(), proyecto_id)
     
     @staticmethod
-    def obtener_todos(usuario_id=None, rol=None):
-        """Obtiene todos los proyectos, filtrados por usuario y rol"""
+    def obtener_todos(usuario_id=None, rol=None, limit=None, despues_de=None, en_flujo=False):
+        """Obtiene todos los proyectos, filtrados por usuario y rol
+        
+        Con limit y despues_de=(fecha_creacion, id) devuelve la página de
+        proyectos posterior a esa clave, en el mismo orden.
+        """
         conn = get_db_connection()
         cursor = conn.cursor()
         
+        filtros = []
+        params = []
+        
         if rol == 'Administrador':
-            cursor.execute('''
+            query = '''
                 SELECT p.*, u.nombre as responsable_nombre
                 FROM proyectos p
                 JOIN usuarios u ON p.responsable_id = u.id
-                ORDER BY p.fecha_creacion DESC
-            ''')
+            '''
         elif rol == 'Gestor':
-            cursor.execute('''
+            query = '''
                 SELECT p.*, u.nombre as responsable_nombre
                 FROM proyectos p
                 JOIN usuarios u ON p.responsable_id = u.id
-                WHERE p.responsable_id = ?
-                ORDER BY p.fecha_creacion DESC
-            ''', (usuario_id,))
+            '''
+            filtros.append('p.responsable_id = ?')
+            params.append(usuario_id)
         else:
             # Colaborador ve proyectos donde tiene tareas asignadas
-            cursor.execute('''
+            query = '''
                 SELECT DISTINCT p.*, u.nombre as responsable_nombre
                 FROM proyectos p
                 JOIN usuarios u ON p.responsable_id = u.id
                 JOIN tareas t ON t.proyecto_id = p.id
-                WHERE t.asignado_a_id = ?
-                ORDER BY p.fecha_creacion DESC
-            ''', (usuario_id,))
+            '''
+            filtros.append('t.asignado_a_id = ?')
+            params.append(usuario_id)
+        
+        if despues_de:
+            filtros.append('(p.fecha_creacion, p.id) < (?, ?)')
+            params.extend(despues_de)
+        
+        if filtros:
+            query += ' WHERE ' + ' AND '.join(filtros)
+        query += ' ORDER BY p.fecha_creacion DESC, p.id DESC'
+        
+        if limit:
+            query += ' LIMIT ?'
+            params.append(limit)
         
-        proyectos = cursor.fetchall()
-        conn.close()
-        return [dict(proyecto) for proyecto in proyectos]
+        cursor.execute(query, params)
+        return _filas(cursor, en_flujo)
     
     @staticmethod
-    def actualizar(proyecto_id, nombre=None, descripcion=None, fecha_inicio=None, 
-                   fecha_fin=None, estado=None):
-        """Actualiza un proyecto"""
+    def tiene_acceso(proyecto_id, usuario_id, rol):
+        """Indica con una única consulta EXISTS si un usuario puede acceder a un proyecto"""
         conn = get_db_connection()
         cursor = conn.cursor()
         
+        if rol == 'Administrador':
+            cursor.execute('SELECT EXISTS (SELECT 1 FROM proyectos WHERE id = ?)', (proyecto_id,))
+        elif rol == 'Gestor':
+            cursor.execute('''
+                SELECT EXISTS (SELECT 1 FROM proyectos WHERE id = ? AND responsable_id = ?)
+            ''', (proyecto_id, usuario_id))
+        elif rol == 'Colaborador':
+            cursor.execute('''
+                SELECT EXISTS (SELECT 1 FROM tareas WHERE asignado_a_id = ? AND proyecto_id = ?)
+            ''', (usuario_id, proyecto_id))
+        else:
+            return False
+        
+        return bool(cursor.fetchone()[0])
+    
+    @staticmethod
+    def actualizar(proyecto_id, nombre=None, descripcion=None, fecha_inicio=None, 
+                   fecha_fin=None, estado=None):
+        """Actualiza un proyecto"""
         updates = []
         values = []
         
@@ -161,14 +308,26 @@ class Proyecto:
             updates.append('estado = ?')
             values.append(estado)
         
-        if updates:
-            values.append(proyecto_id)
-            query = f'UPDATE proyectos SET {", ".join(updates)} WHERE id = ?'
+        if not updates:
+            return Proyecto.obtener_por_id(proyecto_id)
+        
+        values.append(proyecto_id)
+        query = f'UPDATE proyectos SET {", ".join(updates)} WHERE id = ? RETURNING id'
+        
+        def escribir(conn):
+            cursor = conn.cursor()
             cursor.execute(query, values)
-            conn.commit()
+            if cursor.fetchone() is None:
+                return None
+            
+            return Proyecto._leer(cursor, proyecto_id)
         
-        conn.close()
-        return Proyecto.obtener_por_id(proyecto_id)
+        proyecto = ejecutar_escritura(escribir)
+        if proyecto is None:
+            return None
+        
+        hub.publicar('proyecto', 'actualizado', proyecto_id, proyecto)
+        return proyecto
     
     @staticmethod
     def calcular_progreso(proyecto_id):
@@ -176,87 +335,232 @@ class Proyecto:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute('SELECT COUNT(*) as total FROM tareas WHERE proyecto_id = ?', (proyecto_id,))
-        total = cursor.fetchone()['total']
-        
-        cursor.execute('SELECT COUNT(*) as completadas FROM tareas WHERE proyecto_id = ? AND estado = ?', 
-                      (proyecto_id, 'Finalizado'))
-        completadas = cursor.fetchone()['completadas']
-        
-        conn.close()
+        cursor.execute('''
+            SELECT COALESCE(SUM(cantidad), 0) as total,
+                   COALESCE(SUM(CASE WHEN estado = ? THEN cantidad ELSE 0 END), 0) as completadas
+            FROM tareas_contadores
+            WHERE proyecto_id = ?
+        ''', ('Finalizado', proyecto_id))
+        row = cursor.fetchone()
+        total, completadas = row['total'], row['completadas']
         
         if total == 0:
             return 0
         return int((completadas / total) * 100)
+    
+    @staticmethod
+    def purgar_cambios(dias=7):
+        """Borra del registro de cambios de proyectos las entradas con más de `dias` días"""
+        def escribir(conn):
+            cursor = conn.execute("DELETE FROM proyectos_cambios WHERE fecha < datetime('now', ?)",
+                                  (f'-{int(dias)} days',))
+            return cursor.rowcount
+        
+        return ejecutar_escritura(escribir)
 
 class Tarea:
     """Modelo de Tarea"""
     
+    # Tarea con los nombres del asignado, del creador y del proyecto
+    SELECT_DETALLE = '''
+        SELECT t.*, 
+               u1.nombre as asignado_nombre,
+               u2.nombre as creado_por_nombre,
+               p.nombre as proyecto_nombre
+        FROM tareas t
+        LEFT JOIN usuarios u1 ON t.asignado_a_id = u1.id
+        JOIN usuarios u2 ON t.creado_por_id = u2.id
+        JOIN proyectos p ON t.proyecto_id = p.id
+    '''
+    
+    @staticmethod
+    def _leer(cursor, tarea_id):
+        """Lee una tarea con sus joins sobre el cursor (y transacción) dado"""
+        cursor.execute(Tarea.SELECT_DETALLE + ' WHERE t.id = ?', (tarea_id,))
+        tarea = cursor.fetchone()
+        return dict(tarea) if tarea else None
+    
+    @staticmethod
+    def _publicar(accion, tareas):
+        """Publica las tareas escritas, con un evento por proyecto
+        
+        También programa en el planificador sus fechas límite, por si alguna
+        es nueva o la tarea se ha reabierto.
+        """
+        por_proyecto = {}
+        for tarea in tareas:
+            por_proyecto.setdefault(tarea['proyecto_id'], []).append(tarea)
+            vencimientos.programar(tarea.get('fecha_limite'))
+        for proyecto_id, lista in por_proyecto.items():
+            hub.publicar('tareas', accion, proyecto_id, lista)
+    
     @staticmethod
     def crear(titulo, descripcion, proyecto_id, creado_por_id, asignado_a_id=None,
               prioridad='Media', fecha_limite=None):
         """Crea una nueva tarea"""
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        def escribir(conn):
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO tareas (titulo, descripcion, proyecto_id, creado_por_id, 
+                                  asignado_a_id, prioridad, fecha_limite)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                RETURNING id
+            ''', (titulo, descripcion, proyecto_id, creado_por_id, asignado_a_id, 
+                  prioridad, fecha_limite))
+            tarea_id = cursor.fetchone()['id']
+            
+            return Tarea._leer(cursor, tarea_id)
         
-        cursor.execute('''
-            INSERT INTO tareas (titulo, descripcion, proyecto_id, creado_por_id, 
-                              asignado_a_id, prioridad, fecha_limite)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (titulo, descripcion, proyecto_id, creado_por_id, asignado_a_id, 
-              prioridad, fecha_limite))
+        tarea = ejecutar_escritura(escribir)
+        
+        Tarea._publicar('creadas', [tarea])
+        return tarea
+    
+    @staticmethod
+    def crear_varias(tareas, creado_por_id):
+        """Crea varias tareas en una única transacción
+        
+        Cada elemento es un diccionario con los mismos campos que Tarea.crear.
+        Devuelve las tareas creadas, en el mismo orden, leídas con una consulta.
+        """
+        filas = [(t['titulo'], t.get('descripcion', ''), t['proyecto_id'], creado_por_id,
+                  t.get('asignado_a_id'), t.get('prioridad', 'Media'), t.get('fecha_limite'))
+                 for t in tareas]
+        
+        def escribir(conn):
+            cursor = conn.cursor()
+            # El escritor abre la transacción con BEGIN IMMEDIATE: los ids
+            # nuevos son los posteriores al máximo actual
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM tareas')
+            ultimo_id = cursor.fetchone()[0]
+            
+            cursor.executemany('''
+                INSERT INTO tareas (titulo, descripcion, proyecto_id, creado_por_id, 
+                                  asignado_a_id, prioridad, fecha_limite)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', filas)
+            
+            cursor.execute(Tarea.SELECT_DETALLE + ' WHERE t.id > ? ORDER BY t.id', (ultimo_id,))
+            creadas = [dict(tarea) for tarea in cursor.fetchall()]
+            
+            return creadas
         
-        conn.commit()
-        tarea_id = cursor.lastrowid
-        conn.close()
+        creadas = ejecutar_escritura(escribir)
         
-        return Tarea.obtener_por_id(tarea_id)
+        Tarea._publicar('creadas', creadas)
+        return creadas
     
     @staticmethod
     def obtener_por_id(tarea_id):
         """Obtiene una tarea por su ID"""
         conn = get_db_connection()
+        return Tarea._leer(conn.cursor(), tarea_id)
+    
+    @staticmethod
+    def _paginar_por_creacion(params, limit, despues_de):
+        """Condición keyset, orden y límite por (fecha_creacion, id) descendente"""
+        sql = ''
+        if despues_de:
+            sql += ' AND (t.fecha_creacion, t.id) < (?, ?)'
+            params.extend(despues_de)
+        sql += ' ORDER BY t.fecha_creacion DESC, t.id DESC'
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return sql
+    
+    @staticmethod
+    def _paginar_por_limite(params, limit, despues_de):
+        """Condición keyset, orden y límite por (fecha_limite, id) ascendente
+        
+        Las tareas sin fecha límite (NULL) van primero, como en ORDER BY ASC.
+        """
+        sql = ''
+        if despues_de:
+            fecha_limite, tarea_id = despues_de
+            if fecha_limite is None:
+                sql += ' AND ((t.fecha_limite IS NULL AND t.id > ?) OR t.fecha_limite IS NOT NULL)'
+                params.append(tarea_id)
+            else:
+                sql += ' AND (t.fecha_limite, t.id) > (?, ?)'
+                params.extend((fecha_limite, tarea_id))
+        sql += ' ORDER BY t.fecha_limite ASC, t.id ASC'
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return sql
+    
+    @staticmethod
+    def obtener_por_proyecto(proyecto_id, limit=None, despues_de=None, en_flujo=False):
+        """Obtiene todas las tareas de un proyecto
+        
+        Admite paginación por (fecha_creacion, id) como Proyecto.obtener_todos.
+        """
+        conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute('''
+        
+        query = '''
             SELECT t.*, 
                    u1.nombre as asignado_nombre,
-                   u2.nombre as creado_por_nombre,
-                   p.nombre as proyecto_nombre
+                   u2.nombre as creado_por_nombre
             FROM tareas t
             LEFT JOIN usuarios u1 ON t.asignado_a_id = u1.id
             JOIN usuarios u2 ON t.creado_por_id = u2.id
-            JOIN proyectos p ON t.proyecto_id = p.id
-            WHERE t.id = ?
-        ''', (tarea_id,))
-        tarea = cursor.fetchone()
-        conn.close()
-        return dict(tarea) if tarea else None
+            WHERE t.proyecto_id = ?
+        '''
+        params = [proyecto_id]
+        query += Tarea._paginar_por_creacion(params, limit, despues_de)
+        
+        cursor.execute(query, params)
+        return _filas(cursor, en_flujo)
     
     @staticmethod
-    def obtener_por_proyecto(proyecto_id):
-        """Obtiene todas las tareas de un proyecto"""
+    def obtener_visibles(usuario_id, rol, limit=None, despues_de=None, en_flujo=False):
+        """Obtiene en una sola consulta todas las tareas visibles para un usuario
+        
+        Administrador ve todas, Gestor las de los proyectos que dirige y
+        Colaborador las que tiene asignadas. Orden estable: más recientes primero,
+        paginable por (fecha_creacion, id).
+        """
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute('''
+        
+        query = '''
             SELECT t.*, 
                    u1.nombre as asignado_nombre,
-                   u2.nombre as creado_por_nombre
+                   u2.nombre as creado_por_nombre,
+                   p.nombre as proyecto_nombre
             FROM tareas t
             LEFT JOIN usuarios u1 ON t.asignado_a_id = u1.id
             JOIN usuarios u2 ON t.creado_por_id = u2.id
-            WHERE t.proyecto_id = ?
-            ORDER BY t.fecha_creacion DESC
-        ''', (proyecto_id,))
-        tareas = cursor.fetchall()
-        conn.close()
-        return [dict(tarea) for tarea in tareas]
+            JOIN proyectos p ON t.proyecto_id = p.id
+        '''
+        params = []
+        
+        if rol == 'Gestor':
+            query += ' WHERE p.responsable_id = ?'
+            params.append(usuario_id)
+        elif rol != 'Administrador':
+            query += ' WHERE t.asignado_a_id = ?'
+            params.append(usuario_id)
+        else:
+            query += ' WHERE 1 = 1'
+        
+        query += Tarea._paginar_por_creacion(params, limit, despues_de)
+        
+        cursor.execute(query, params)
+        return _filas(cursor, en_flujo)
     
     @staticmethod
-    def obtener_por_usuario(usuario_id):
-        """Obtiene todas las tareas asignadas a un usuario"""
+    def obtener_por_usuario(usuario_id, limit=None, despues_de=None, en_flujo=False):
+        """Obtiene todas las tareas asignadas a un usuario
+        
+        Admite paginación por (fecha_limite, id).
+        """
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute('''
+        
+        query = '''
             SELECT t.*, 
                    u.nombre as creado_por_nombre,
                    p.nombre as proyecto_nombre
@@ -264,15 +568,20 @@ class Tarea:
             JOIN usuarios u ON t.creado_por_id = u.id
             JOIN proyectos p ON t.proyecto_id = p.id
             WHERE t.asignado_a_id = ?
-            ORDER BY t.fecha_limite ASC
-        ''', (usuario_id,))
-        tareas = cursor.fetchall()
-        conn.close()
-        return [dict(tarea) for tarea in tareas]
+        '''
+        params = [usuario_id]
+        query += Tarea._paginar_por_limite(params, limit, despues_de)
+        
+        cursor.execute(query, params)
+        return _filas(cursor, en_flujo)
     
     @staticmethod
-    def obtener_por_estado(estado, usuario_id=None, proyecto_id=None):
-        """Obtiene tareas por estado, opcionalmente filtradas por usuario o proyecto"""
+    def obtener_por_estado(estado, usuario_id=None, proyecto_id=None, limit=None, despues_de=None,
+                           en_flujo=False):
+        """Obtiene tareas por estado, opcionalmente filtradas por usuario o proyecto
+        
+        Admite paginación por (fecha_limite, id).
+        """
         conn = get_db_connection()
         cursor = conn.cursor()
         
@@ -297,37 +606,96 @@ class Tarea:
             query += ' AND t.proyecto_id = ?'
             params.append(proyecto_id)
         
-        query += ' ORDER BY t.fecha_limite ASC'
+        query += Tarea._paginar_por_limite(params, limit, despues_de)
         
         cursor.execute(query, params)
-        tareas = cursor.fetchall()
-        conn.close()
-        return [dict(tarea) for tarea in tareas]
+        return _filas(cursor, en_flujo)
     
     @staticmethod
     def actualizar_estado(tarea_id, nuevo_estado):
         """Actualiza el estado de una tarea"""
+        def escribir(conn):
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE tareas 
+                SET estado = ?, fecha_actualizacion = CURRENT_TIMESTAMP, version = version + 1
+                WHERE id = ?
+                RETURNING proyecto_id, asignado_a_id
+            ''', (nuevo_estado, tarea_id))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            
+            return Tarea._leer(cursor, tarea_id)
+        
+        tarea = ejecutar_escritura(escribir)
+        if tarea is None:
+            return None
+        
+        Tarea._publicar('actualizadas', [tarea])
+        return tarea
+    
+    @staticmethod
+    def obtener_varias(tarea_ids):
+        """Obtiene id, proyecto, asignado y versión de varias tareas con una consulta"""
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            UPDATE tareas 
-            SET estado = ?, fecha_actualizacion = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (nuevo_estado, tarea_id))
+        marcadores = ', '.join('?' * len(tarea_ids))
+        cursor.execute(f'''
+            SELECT id, proyecto_id, asignado_a_id, estado, version
+            FROM tareas
+            WHERE id IN ({marcadores})
+        ''', list(tarea_ids))
+        return {row['id']: dict(row) for row in cursor.fetchall()}
+    
+    @staticmethod
+    def actualizar_estados(cambios):
+        """Aplica varios cambios de estado en una única transacción
+        
+        cambios es una lista de {'id', 'estado', 'expected_version'}; si se
+        indica expected_version y no coincide con la versión actual, no se
+        aplica ningún cambio. Devuelve (tareas_actualizadas, ids_en_conflicto).
+        """
+        ids = [cambio['id'] for cambio in cambios]
+        marcadores = ', '.join('?' * len(ids))
         
-        conn.commit()
-        conn.close()
+        def escribir(conn):
+            cursor = conn.cursor()
+            conflictos = []
+            for cambio in cambios:
+                query = '''
+                    UPDATE tareas
+                    SET estado = ?, fecha_actualizacion = CURRENT_TIMESTAMP, version = version + 1
+                    WHERE id = ?
+                '''
+                params = [cambio['estado'], cambio['id']]
+                if cambio.get('expected_version') is not None:
+                    query += ' AND version = ?'
+                    params.append(cambio['expected_version'])
+                cursor.execute(query, params)
+                if cursor.rowcount == 0:
+                    conflictos.append(cambio['id'])
+            
+            if conflictos:
+                raise Deshacer(([], conflictos))
+            
+            cursor.execute(Tarea.SELECT_DETALLE + f' WHERE t.id IN ({marcadores}) ORDER BY t.id', ids)
+            tareas = [dict(tarea) for tarea in cursor.fetchall()]
+            
+            return tareas, []
         
-        return Tarea.obtener_por_id(tarea_id)
+        tareas, conflictos = ejecutar_escritura(escribir)
+        if conflictos:
+            return [], conflictos
+        
+        Tarea._publicar('actualizadas', tareas)
+        return tareas, []
     
     @staticmethod
     def actualizar(tarea_id, titulo=None, descripcion=None, asignado_a_id=None,
-                   prioridad=None, fecha_limite=None):
+                   prioridad=None, fecha_limite=None, estado=None):
         """Actualiza una tarea"""
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         updates = []
         values = []
         
@@ -346,35 +714,230 @@ class Tarea:
         if fecha_limite is not None:
             updates.append('fecha_limite = ?')
             values.append(fecha_limite)
+        if estado:
+            updates.append('estado = ?')
+            values.append(estado)
+        
+        if not updates:
+            return Tarea.obtener_por_id(tarea_id)
         
-        if updates:
-            updates.append('fecha_actualizacion = CURRENT_TIMESTAMP')
-            values.append(tarea_id)
-            query = f'UPDATE tareas SET {", ".join(updates)} WHERE id = ?'
+        updates.append('fecha_actualizacion = CURRENT_TIMESTAMP')
+        updates.append('version = version + 1')
+        values.append(tarea_id)
+        query = f'UPDATE tareas SET {", ".join(updates)} WHERE id = ? RETURNING proyecto_id, asignado_a_id'
+        
+        def escribir(conn):
+            cursor = conn.cursor()
+            anterior_id = None
+            if asignado_a_id is not None:
+                # El asignado anterior debe recibir el evento de la reasignación
+                cursor.execute('SELECT asignado_a_id FROM tareas WHERE id = ?', (tarea_id,))
+                anterior = cursor.fetchone()
+                if anterior:
+                    anterior_id = anterior['asignado_a_id']
+            
             cursor.execute(query, values)
-            conn.commit()
+            row = cursor.fetchone()
+            if row is None:
+                return None, None
+            
+            return Tarea._leer(cursor, tarea_id), anterior_id
+        
+        tarea, anterior_id = ejecutar_escritura(escribir)
+        if tarea is None:
+            return None
         
-        conn.close()
-        return Tarea.obtener_por_id(tarea_id)
+        # El asignado anterior debe enterarse de que deja de ver la tarea
+        Tarea._publicar('actualizadas', [{**tarea, 'asignado_anterior_id': anterior_id}])
+        return tarea
     
     @staticmethod
-    def esta_retrasada(tarea):
-        """Verifica si una tarea está retrasada"""
-        if tarea['estado'] == 'Finalizado':
-            return False
+    def obtener_version_cambios():
+        """Último seq asignado en tareas_cambios (cursor inicial del feed)"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'tareas_cambios'")
+        row = cursor.fetchone()
+        return row['seq'] if row else 0
+    
+    @staticmethod
+    def obtener_cambios(desde, usuario_id, rol, limit=1000):
+        """Obtiene las tareas creadas, modificadas o eliminadas después de un cursor
+        
+        Devuelve {'version', 'hay_mas', 'tareas', 'eliminadas'}: tareas trae el
+        estado actual de cada tarea cambiada que el usuario puede ver y
+        eliminadas los ids borrados o que ya no le son visibles. Devuelve None
+        si los cambios posteriores a desde ya fueron purgados.
+        """
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT version FROM versiones_datos WHERE ambito = 'tareas_cambios_purgado'")
+        if desde < cursor.fetchone()['version']:
+            return None
+        
+        # Búsqueda por rango sobre la clave primaria: sin cambios cuesta una sola búsqueda
+        cursor.execute('''
+            SELECT c.seq, c.tarea_id, c.asignado_a_id, c.asignado_anterior_id, p.responsable_id
+            FROM tareas_cambios c
+            LEFT JOIN proyectos p ON c.proyecto_id = p.id
+            WHERE c.seq > ?
+            ORDER BY c.seq
+            LIMIT ?
+        ''', (desde, limit + 1))
+        filas = cursor.fetchall()
+        hay_mas = len(filas) > limit
+        filas = filas[:limit]
+        
+        def afecta(fila):
+            if rol == 'Administrador':
+                return True
+            if rol == 'Gestor':
+                return fila['responsable_id'] == usuario_id
+            return usuario_id in (fila['asignado_a_id'], fila['asignado_anterior_id'])
+        
+        ids = list(dict.fromkeys(fila['tarea_id'] for fila in filas if afecta(fila)))
+        actuales = {}
+        for inicio in range(0, len(ids), 500):
+            lote = ids[inicio:inicio + 500]
+            marcadores = ', '.join('?' * len(lote))
+            cursor.execute(Tarea.SELECT_DETALLE + f' WHERE t.id IN ({marcadores})', lote)
+            for row in cursor.fetchall():
+                # El proyecto de una tarea no cambia: para Gestor basta con afecta()
+                if rol != 'Colaborador' or row['asignado_a_id'] == usuario_id:
+                    actuales[row['id']] = dict(row)
+        
+        return {
+            'version': filas[-1]['seq'] if filas else desde,
+            'hay_mas': hay_mas,
+            'tareas': [actuales[i] for i in ids if i in actuales],
+            'eliminadas': [i for i in ids if i not in actuales]
+        }
+    
+    @staticmethod
+    def purgar_cambios(dias=7):
+        """Borra del registro de cambios las entradas con más de `dias` días"""
+        def escribir(conn):
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT MAX(seq) as hasta FROM tareas_cambios
+                WHERE fecha < datetime('now', ?)
+            ''', (f'-{int(dias)} days',))
+            hasta = cursor.fetchone()['hasta']
+            if hasta is None:
+                return 0
+            
+            cursor.execute('DELETE FROM tareas_cambios WHERE seq <= ?', (hasta,))
+            borradas = cursor.rowcount
+            cursor.execute('''
+                UPDATE versiones_datos SET version = MAX(version, ?)
+                WHERE ambito = 'tareas_cambios_purgado'
+            ''', (hasta,))
+            return borradas
+        
+        return ejecutar_escritura(escribir)
+    
+    @staticmethod
+    def marcar_retrasadas():
+        """Marca como retrasadas las tareas abiertas cuya fecha límite ya pasó
         
-        if tarea['fecha_limite']:
-            fecha_limite = datetime.strptime(tarea['fecha_limite'], '%Y-%m-%d').date()
-            return fecha_limite < date.today()
+        Los triggers mantienen la marca al escribir una tarea; esto aplica el
+        paso del tiempo (ver vencimientos.py). Devuelve las tareas marcadas.
+        """
+        def escribir(conn):
+            marcadas = [dict(row) for row in conn.execute('''
+                UPDATE tareas SET retrasada = 1
+                WHERE estado != 'Finalizado' AND fecha_limite IS NOT NULL
+                  AND fecha_limite < date('now') AND retrasada = 0
+                RETURNING id, proyecto_id, asignado_a_id
+            ''').fetchall()]
+            return marcadas
         
-        return False
+        marcadas = ejecutar_escritura(escribir)
+        
+        Tarea._publicar('retrasadas', marcadas)
+        return marcadas
+    
+    @staticmethod
+    def proximas_fechas_limite(limite):
+        """Fechas límite distintas de tareas abiertas a partir de hoy, en orden"""
+        conn = get_db_connection()
+        cursor = conn.execute('''
+            SELECT DISTINCT fecha_limite FROM tareas
+            WHERE estado != 'Finalizado' AND fecha_limite IS NOT NULL
+              AND fecha_limite >= date('now')
+            ORDER BY fecha_limite
+            LIMIT ?
+        ''', (limite,))
+        return [row['fecha_limite'] for row in cursor.fetchall()]
 
 class Reporte:
     """Modelo para generar reportes"""
     
+    # Conteos por estado desde la tabla de contadores (mantenida por triggers)
+    CONTEO_POR_ESTADO = '''
+        SELECT {columnas}estado, SUM(cantidad) as cantidad
+        FROM tareas_contadores
+        {condicion}
+        GROUP BY {columnas}estado
+        HAVING SUM(cantidad) > 0
+    '''
+    
+    # Retrasadas según la marca persistente, sobre el índice parcial idx_tareas_retrasadas
+    CONTEO_RETRASADAS = '''
+        SELECT {columnas}COUNT(*) as retrasadas
+        FROM tareas
+        WHERE retrasada = 1
+        {condicion}
+        {agrupacion}
+    '''
+    
+    # Límite de parámetros por sentencia en el cálculo por lotes
+    TAMANO_LOTE = 500
+    
+    @staticmethod
+    def _resumir(filas, tareas_retrasadas, incluir_por_estado=True):
+        """Construye las métricas a partir de los conteos por estado"""
+        tareas_por_estado = {row['estado']: row['cantidad'] for row in filas}
+        total_tareas = sum(tareas_por_estado.values())
+        tareas_completadas = tareas_por_estado.get('Finalizado', 0)
+        
+        metricas = {
+            'total_tareas': total_tareas,
+            'tareas_completadas': tareas_completadas,
+            'tareas_retrasadas': tareas_retrasadas,
+        }
+        if incluir_por_estado:
+            metricas['tareas_por_estado'] = tareas_por_estado
+        metricas['porcentaje_completado'] = int((tareas_completadas / total_tareas * 100)) if total_tareas > 0 else 0
+        return metricas
+    
+    @staticmethod
+    def _metricas(columna=None, valor=None, incluir_por_estado=True):
+        """Métricas globales o filtradas por una columna de tareas"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        condicion = f'WHERE {columna} = ?' if columna else ''
+        params = (valor,) if columna else ()
+        cursor.execute(Reporte.CONTEO_POR_ESTADO.format(columnas='', condicion=condicion), params)
+        filas = cursor.fetchall()
+        
+        condicion = f'AND {columna} = ?' if columna else ''
+        cursor.execute(Reporte.CONTEO_RETRASADAS.format(columnas='', condicion=condicion, agrupacion=''),
+                      params)
+        tareas_retrasadas = cursor.fetchone()['retrasadas']
+        
+        return Reporte._resumir(filas, tareas_retrasadas, incluir_por_estado)
+    
     @staticmethod
     def obtener_metricas_generales():
         """Obtiene métricas generales del sistema"""
+        return cache_reportes.obtener_o_calcular('generales', Reporte._calcular_metricas_generales)
+    
+    @staticmethod
+    def _calcular_metricas_generales():
+        """Calcula las métricas generales sin pasar por la caché"""
         conn = get_db_connection()
         cursor = conn.cursor()
         
@@ -382,112 +945,275 @@ class Reporte:
         cursor.execute('SELECT COUNT(*) as total FROM proyectos')
         total_proyectos = cursor.fetchone()['total']
         
-        # Total de tareas
-        cursor.execute('SELECT COUNT(*) as total FROM tareas')
-        total_tareas = cursor.fetchone()['total']
+        return {'total_proyectos': total_proyectos, **Reporte._metricas()}
+    
+    @staticmethod
+    def obtener_metricas_proyecto(proyecto_id):
+        """Obtiene métricas de un proyecto específico"""
+        return cache_reportes.obtener_o_calcular(
+            'proyecto', lambda: Reporte._metricas('proyecto_id', proyecto_id),
+            proyecto_id=proyecto_id
+        )
+    
+    @staticmethod
+    def obtener_metricas_proyectos(proyecto_ids):
+        """Obtiene las métricas de varios proyectos con una consulta por lote
+        
+        Devuelve un diccionario {proyecto_id: métricas}; los proyectos sin
+        tareas aparecen con todas las métricas a cero.
+        """
+        conn = get_db_connection()
+        cursor = conn.cursor()
         
-        # Tareas completadas
-        cursor.execute('SELECT COUNT(*) as total FROM tareas WHERE estado = ?', ('Finalizado',))
-        tareas_completadas = cursor.fetchone()['total']
+        ids = list(dict.fromkeys(proyecto_ids))
+        filas_por_proyecto = {proyecto_id: [] for proyecto_id in ids}
+        retrasadas_por_proyecto = dict.fromkeys(ids, 0)
         
-        # Tareas retrasadas
-        cursor.execute('''
-            SELECT COUNT(*) as total 
-            FROM tareas 
-            WHERE estado != ? AND fecha_limite < date('now')
-        ''', ('Finalizado',))
-        tareas_retrasadas = cursor.fetchone()['total']
+        for inicio in range(0, len(ids), Reporte.TAMANO_LOTE):
+            lote = ids[inicio:inicio + Reporte.TAMANO_LOTE]
+            marcadores = ', '.join('?' * len(lote))
+            
+            cursor.execute(Reporte.CONTEO_POR_ESTADO.format(
+                columnas='proyecto_id, ',
+                condicion=f'WHERE proyecto_id IN ({marcadores})'
+            ), lote)
+            for row in cursor.fetchall():
+                filas_por_proyecto[row['proyecto_id']].append(row)
+            
+            cursor.execute(Reporte.CONTEO_RETRASADAS.format(
+                columnas='proyecto_id, ',
+                condicion=f'AND proyecto_id IN ({marcadores})',
+                agrupacion='GROUP BY proyecto_id'
+            ), lote)
+            for row in cursor.fetchall():
+                retrasadas_por_proyecto[row['proyecto_id']] = row['retrasadas']
         
-        # Tareas por estado
-        cursor.execute('''
-            SELECT estado, COUNT(*) as cantidad
-            FROM tareas
-            GROUP BY estado
-        ''')
-        tareas_por_estado = {row['estado']: row['cantidad'] for row in cursor.fetchall()}
+        return {proyecto_id: Reporte._resumir(filas, retrasadas_por_proyecto[proyecto_id])
+                for proyecto_id, filas in filas_por_proyecto.items()}
+    
+    @staticmethod
+    def obtener_metricas_usuario(usuario_id):
+        """Obtiene métricas de un usuario específico"""
+        return cache_reportes.obtener_o_calcular(
+            'usuario', lambda: Reporte._metricas('asignado_a_id', usuario_id, incluir_por_estado=False),
+            usuario_id=usuario_id
+        )
+    
+    @staticmethod
+    def obtener_resumen_dashboard(usuario_id, rol):
+        """Conteos, proyectos recientes y próximas tareas pendientes del dashboard
+        
+        Todo se resuelve con agregados y consultas con LIMIT, según el rol:
+        Administrador ve todo, Gestor sus proyectos y Colaborador sus tareas.
+        """
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        if rol == 'Administrador':
+            condicion, params = '', ()
+            cursor.execute('SELECT COUNT(*) as total FROM proyectos')
+        elif rol == 'Gestor':
+            condicion = 'proyecto_id IN (SELECT id FROM proyectos WHERE responsable_id = ?)'
+            params = (usuario_id,)
+            cursor.execute('SELECT COUNT(*) as total FROM proyectos WHERE responsable_id = ?', params)
+        else:
+            condicion, params = 'asignado_a_id = ?', (usuario_id,)
+            cursor.execute('''
+                SELECT COUNT(DISTINCT proyecto_id) as total FROM tareas WHERE asignado_a_id = ?
+            ''', params)
+        total_proyectos = cursor.fetchone()['total']
+        
+        cursor.execute(Reporte.CONTEO_POR_ESTADO.format(
+            columnas='', condicion=f'WHERE {condicion}' if condicion else ''
+        ), params)
+        filas = cursor.fetchall()
         
-        conn.close()
+        cursor.execute(Reporte.CONTEO_RETRASADAS.format(
+            columnas='', condicion=f'AND {condicion}' if condicion else '', agrupacion=''
+        ), params)
+        tareas_retrasadas = cursor.fetchone()['retrasadas']
+        
+        # Pendientes más próximas a vencer; las que no tienen fecha límite, al final
+        query = '''
+            SELECT t.*, p.nombre as proyecto_nombre
+            FROM tareas t
+            JOIN proyectos p ON t.proyecto_id = p.id
+            WHERE t.estado = 'Pendiente'
+        '''
+        if condicion:
+            query += f' AND t.{condicion}'
+        query += ' ORDER BY t.fecha_limite IS NULL, t.fecha_limite, t.id LIMIT 5'
+        cursor.execute(query, params)
+        tareas_pendientes = [dict(tarea) for tarea in cursor.fetchall()]
         
         return {
             'total_proyectos': total_proyectos,
-            'total_tareas': total_tareas,
-            'tareas_completadas': tareas_completadas,
-            'tareas_retrasadas': tareas_retrasadas,
-            'tareas_por_estado': tareas_por_estado,
-            'porcentaje_completado': int((tareas_completadas / total_tareas * 100)) if total_tareas > 0 else 0
+            **Reporte._resumir(filas, tareas_retrasadas, incluir_por_estado=False),
+            'proyectos_recientes': Proyecto.obtener_todos(usuario_id, rol, limit=5),
+            'tareas_pendientes': tareas_pendientes
         }
     
+    # Diferencias entre los contadores y un recuento real sobre tareas
+    DIFERENCIAS_CONTADORES = '''
+        SELECT proyecto_id, asignado_a_id, estado,
+               SUM(real) as real, SUM(contado) as contado
+        FROM (
+            SELECT proyecto_id, COALESCE(asignado_a_id, 0) as asignado_a_id, estado,
+                   COUNT(*) as real, 0 as contado
+            FROM tareas
+            GROUP BY proyecto_id, COALESCE(asignado_a_id, 0), estado
+            UNION ALL
+            SELECT proyecto_id, asignado_a_id, estado, 0 as real, cantidad as contado
+            FROM tareas_contadores
+        )
+        GROUP BY proyecto_id, asignado_a_id, estado
+        HAVING SUM(real) != SUM(contado)
+    '''
+    
     @staticmethod
-    def obtener_metricas_proyecto(proyecto_id):
-        """Obtiene métricas de un proyecto específico"""
+    def verificar_contadores():
+        """Compara tareas_contadores con un recuento real y devuelve las diferencias"""
         conn = get_db_connection()
         cursor = conn.cursor()
+        cursor.execute(Reporte.DIFERENCIAS_CONTADORES)
+        return [dict(row) for row in cursor.fetchall()]
+    
+    @staticmethod
+    def reconstruir_contadores():
+        """Reconstruye tareas_contadores desde cero a partir de tareas"""
+        def escribir(conn):
+            conn.execute('DELETE FROM tareas_contadores')
+            conn.execute('''
+                INSERT INTO tareas_contadores (proyecto_id, asignado_a_id, estado, cantidad)
+                SELECT proyecto_id, COALESCE(asignado_a_id, 0), estado, COUNT(*)
+                FROM tareas
+                GROUP BY proyecto_id, COALESCE(asignado_a_id, 0), estado
+            ''')
         
-        # Total de tareas del proyecto
-        cursor.execute('SELECT COUNT(*) as total FROM tareas WHERE proyecto_id = ?', (proyecto_id,))
-        total_tareas = cursor.fetchone()['total']
+        ejecutar_escritura(escribir)
+
+class Busqueda:
+    """Búsqueda de texto completo sobre tareas y proyectos (FTS5, migración 10)"""
+    
+    # Marcas de coincidencia (char(2) y char(3) en SQL); pasan a <mark> tras escapar el texto
+    INICIO, FIN = '\x02', '\x03'
+    # Términos como máximo por búsqueda
+    MAX_TERMINOS = 10
+    
+    @staticmethod
+    def consulta_fts(texto):
+        """Convierte el texto del usuario en una consulta FTS5 segura
         
-        # Tareas completadas
-        cursor.execute('SELECT COUNT(*) as total FROM tareas WHERE proyecto_id = ? AND estado = ?', 
-                      (proyecto_id, 'Finalizado'))
-        tareas_completadas = cursor.fetchone()['total']
+        Cada palabra se busca entre comillas (sin operadores FTS5) y como
+        prefijo si tiene al menos dos letras; todas deben aparecer. Devuelve
+        None si el texto no tiene ninguna palabra.
+        """
+        terminos = re.findall(r'\w+', texto or '')[:Busqueda.MAX_TERMINOS]
+        if not terminos:
+            return None
+        return ' '.join(f'"{termino}"*' if len(termino) > 1 else f'"{termino}"'
+                        for termino in terminos)
+    
+    @staticmethod
+    def _resaltar(texto):
+        """HTML seguro con las coincidencias entre <mark>"""
+        if not texto:
+            return ''
+        return (html.escape(texto)
+                .replace(Busqueda.INICIO, '<mark>')
+                .replace(Busqueda.FIN, '</mark>'))
+    
+    @staticmethod
+    def _paginar_por_relevancia(fts, alias, params, limit, despues_de):
+        """Condición keyset, orden y límite por (relevancia, id); más relevantes primero"""
+        sql = ''
+        if despues_de:
+            sql += f' AND ({fts}.rank, {alias}.id) > (?, ?)'
+            params.extend(despues_de)
+        sql += f' ORDER BY {fts}.rank, {alias}.id LIMIT ?'
+        params.append(limit)
+        return sql
+    
+    @staticmethod
+    def tareas(consulta, usuario_id, rol, proyecto_id=None, limit=20, despues_de=None):
+        """Tareas visibles para el usuario que coinciden con la consulta FTS5
         
-        # Tareas retrasadas
-        cursor.execute('''
-            SELECT COUNT(*) as total 
-            FROM tareas 
-            WHERE proyecto_id = ? AND estado != ? AND fecha_limite < date('now')
-        ''', (proyecto_id, 'Finalizado'))
-        tareas_retrasadas = cursor.fetchone()['total']
+        Mismas reglas de visibilidad que Tarea.obtener_visibles.
+        """
+        conn = get_db_connection()
         
-        # Tareas por estado
-        cursor.execute('''
-            SELECT estado, COUNT(*) as cantidad
-            FROM tareas
-            WHERE proyecto_id = ?
-            GROUP BY estado
-        ''', (proyecto_id,))
-        tareas_por_estado = {row['estado']: row['cantidad'] for row in cursor.fetchall()}
+        query = '''
+            SELECT t.*,
+                   u1.nombre as asignado_nombre,
+                   u2.nombre as creado_por_nombre,
+                   p.nombre as proyecto_nombre,
+                   tareas_fts.rank as relevancia,
+                   highlight(tareas_fts, 0, char(2), char(3)) as titulo_resaltado,
+                   snippet(tareas_fts, 1, char(2), char(3), '…', 16) as descripcion_fragmento
+            FROM tareas_fts
+            JOIN tareas t ON t.id = tareas_fts.rowid
+            LEFT JOIN usuarios u1 ON t.asignado_a_id = u1.id
+            JOIN usuarios u2 ON t.creado_por_id = u2.id
+            JOIN proyectos p ON t.proyecto_id = p.id
+            WHERE tareas_fts MATCH ?
+        '''
+        params = [consulta]
         
-        conn.close()
+        if rol == 'Gestor':
+            query += ' AND p.responsable_id = ?'
+            params.append(usuario_id)
+        elif rol != 'Administrador':
+            query += ' AND t.asignado_a_id = ?'
+            params.append(usuario_id)
         
-        return {
-            'total_tareas': total_tareas,
-            'tareas_completadas': tareas_completadas,
-            'tareas_retrasadas': tareas_retrasadas,
-            'tareas_por_estado': tareas_por_estado,
-            'porcentaje_completado': int((tareas_completadas / total_tareas * 100)) if total_tareas > 0 else 0
-        }
+        if proyecto_id:
+            query += ' AND t.proyecto_id = ?'
+            params.append(proyecto_id)
+        
+        query += Busqueda._paginar_por_relevancia('tareas_fts', 't', params, limit, despues_de)
+        
+        tareas = []
+        for row in conn.execute(query, params).fetchall():
+            tarea = dict(row)
+            tarea['titulo_resaltado'] = Busqueda._resaltar(tarea['titulo_resaltado'])
+            tarea['descripcion_fragmento'] = Busqueda._resaltar(tarea['descripcion_fragmento'])
+            tareas.append(tarea)
+        return tareas
     
     @staticmethod
-    def obtener_metricas_usuario(usuario_id):
-        """Obtiene métricas de un usuario específico"""
-        conn = get_db_connection()
-        cursor = conn.cursor()
+    def proyectos(consulta, usuario_id, rol, limit=20, despues_de=None):
+        """Proyectos visibles para el usuario que coinciden con la consulta FTS5
         
-        # Total de tareas asignadas
-        cursor.execute('SELECT COUNT(*) as total FROM tareas WHERE asignado_a_id = ?', (usuario_id,))
-        total_tareas = cursor.fetchone()['total']
+        Mismas reglas de visibilidad que Proyecto.obtener_todos.
+        """
+        conn = get_db_connection()
         
-        # Tareas completadas
-        cursor.execute('SELECT COUNT(*) as total FROM tareas WHERE asignado_a_id = ? AND estado = ?', 
-                      (usuario_id, 'Finalizado'))
-        tareas_completadas = cursor.fetchone()['total']
+        query = '''
+            SELECT p.*, u.nombre as responsable_nombre,
+                   proyectos_fts.rank as relevancia,
+                   highlight(proyectos_fts, 0, char(2), char(3)) as nombre_resaltado,
+                   snippet(proyectos_fts, 1, char(2), char(3), '…', 16) as descripcion_fragmento
+            FROM proyectos_fts
+            JOIN proyectos p ON p.id = proyectos_fts.rowid
+            JOIN usuarios u ON p.responsable_id = u.id
+            WHERE proyectos_fts MATCH ?
+        '''
+        params = [consulta]
         
-        # Tareas retrasadas
-        cursor.execute('''
-            SELECT COUNT(*) as total 
-            FROM tareas 
-            WHERE asignado_a_id = ? AND estado != ? AND fecha_limite < date('now')
-        ''', (usuario_id, 'Finalizado'))
-        tareas_retrasadas = cursor.fetchone()['total']
+        if rol == 'Gestor':
+            query += ' AND p.responsable_id = ?'
+            params.append(usuario_id)
+        elif rol != 'Administrador':
+            # Colaborador ve proyectos donde tiene tareas asignadas
+            query += ' AND EXISTS (SELECT 1 FROM tareas t WHERE t.asignado_a_id = ? AND t.proyecto_id = p.id)'
+            params.append(usuario_id)
         
-        conn.close()
+        query += Busqueda._paginar_por_relevancia('proyectos_fts', 'p', params, limit, despues_de)
         
-        return {
-            'total_tareas': total_tareas,
-            'tareas_completadas': tareas_completadas,
-            'tareas_retrasadas': tareas_retrasadas,
-            'porcentaje_completado': int((tareas_completadas / total_tareas * 100)) if total_tareas > 0 else 0
-        }
-
+        proyectos = []
+        for row in conn.execute(query, params).fetchall():
+            proyecto = dict(row)
+            proyecto['nombre_resaltado'] = Busqueda._resaltar(proyecto['nombre_resaltado'])
+            proyecto['descripcion_fragmento'] = Busqueda._resaltar(proyecto['descripcion_fragmento'])
+            proyectos.append(proyecto)
+        return proyectos
@@ -0,0 +1,71 @@
+"""
+Paginación por cursor (keyset) para los listados de la API
+"""
+import base64
+import binascii
+import json
+
+from database import ENTERO_MAX, ENTERO_MIN
+
+LIMITE_MAXIMO = 500
+
+def codificar_cursor(valores):
+    """Codifica los valores de la última fila en un cursor opaco"""
+    datos = json.dumps(list(valores), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(datos).decode('ascii').rstrip('=')
+
+def decodificar_cursor(cursor):
+    """Decodifica un cursor opaco; lanza ValueError si no es válido"""
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError('Cursor inválido') from e
+    
+    if not isinstance(valores, list) or len(valores) != 2:
+        raise ValueError('Cursor inválido')
+    clave, ultimo_id = valores
+    # Ambos valores se enlazan en SQL: solo escalares (bool es subclase de int)
+    # y enteros que quepan en 64 bits
+    if not isinstance(ultimo_id, int) or isinstance(ultimo_id, bool):
+        raise ValueError('Cursor inválido')
+    if clave is not None and (not isinstance(clave, (str, int, float)) or isinstance(clave, bool)):
+        raise ValueError('Cursor inválido')
+    if any(isinstance(valor, int) and not ENTERO_MIN <= valor <= ENTERO_MAX for valor in valores):
+        raise ValueError('Cursor inválido')
+    return clave, ultimo_id
+
+def leer_parametros(args):
+    """Lee limit y cursor de la query string
+    
+    Devuelve (limit, despues_de); limit es None si el llamador no pagina.
+    Lanza ValueError si los parámetros no son válidos.
+    """
+    limit = args.get('limit')
+    cursor = args.get('cursor')
+    
+    if limit is None:
+        if cursor:
+            raise ValueError('El parámetro cursor requiere limit')
+        return None, None
+    
+    try:
+        limit = int(limit)
+    except ValueError as e:
+        raise ValueError('El parámetro limit debe ser un entero') from e
+    if not 1 <= limit <= LIMITE_MAXIMO:
+        raise ValueError(f'El parámetro limit debe estar entre 1 y {LIMITE_MAXIMO}')
+    
+    return limit, decodificar_cursor(cursor) if cursor else None
+
+def paginar(filas, limit, clave):
+    """Recorta filas (consultadas con limit + 1) y calcula el siguiente cursor
+    
+    clave es la columna de orden que acompaña al id, p. ej. 'fecha_creacion'.
+    """
+    items = filas[:limit]
+    next_cursor = None
+    if len(filas) > limit:
+        ultima = items[-1]
+        next_cursor = codificar_cursor((ultima[clave], ultima['id']))
+    return {'items': items, 'next_cursor': next_cursor}
@@ -0,0 +1,18 @@
+"""
+Script para purgar los registros de cambios de tareas y proyectos
+
+Uso:
+    python purgar_cambios.py [días]   # por defecto conserva 7 días
+"""
+import sys
+
+from database import release_thread_connection
+from models import Proyecto, Tarea
+
+if __name__ == '__main__':
+    dias = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+    borradas = Tarea.purgar_cambios(dias)
+    borrados_proyectos = Proyecto.purgar_cambios(dias)
+    release_thread_connection()
+    print(f"✓ {borradas} cambios de tareas anteriores a {dias} días purgados")
+    print(f"✓ {borrados_proyectos} cambios de proyectos anteriores a {dias} días purgados")
@@ -0,0 +1,108 @@
+"""
+Respuestas JSON en flujo y compresión negociada de la API
+
+Los listados completos se serializan fila a fila mientras se recorre el
+cursor de SQLite, sin construir la lista entera en memoria. Las respuestas
+de /api/ se comprimen con brotli (si está instalado) o gzip según
+Accept-Encoding, también cuando van en flujo.
+"""
+import gzip
+import os
+import zlib
+from flask import Response, current_app, request, stream_with_context
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bytes mínimos de una respuesta completa para comprimirla
+COMPRESION_MINIMO = int(os.environ.get('COMPRESION_MINIMO', '1024'))
+COMPRESION_NIVEL_GZIP = int(os.environ.get('COMPRESION_NIVEL_GZIP', '6'))
+COMPRESION_NIVEL_BROTLI = int(os.environ.get('COMPRESION_NIVEL_BROTLI', '4'))
+# Filas serializadas por cada fragmento enviado en una respuesta en flujo
+FILAS_POR_FRAGMENTO = 200
+
+def json_en_flujo(filas):
+    """Respuesta con un array JSON que se genera a medida que llegan las filas
+    
+    filas puede ser cualquier iterable de diccionarios, p. ej. un generador
+    sobre el cursor. La conexión de la petición sigue abierta hasta terminar.
+    """
+    def generar():
+        dumps = current_app.json.dumps
+        partes = ['[']
+        separador = ''
+        for fila in filas:
+            partes.append(separador + dumps(fila))
+            separador = ','
+            if len(partes) >= FILAS_POR_FRAGMENTO:
+                yield ''.join(partes)
+                partes = []
+        partes.append(']\n')
+        yield ''.join(partes)
+    
+    return Response(stream_with_context(generar()), mimetype='application/json')
+
+def elegir_codificacion():
+    """Mejor codificación aceptada por el cliente, o None"""
+    disponibles = ['br', 'gzip'] if brotli else ['gzip']
+    return request.accept_encodings.best_match(disponibles)
+
+def _compresor(codificacion):
+    """Objeto con compress() y flush() para la codificación dada"""
+    if codificacion == 'br':
+        compresor = brotli.Compressor(quality=COMPRESION_NIVEL_BROTLI)
+        return compresor.process, compresor.finish
+    # wbits = 31: formato gzip con cabecera y CRC
+    compresor = zlib.compressobj(COMPRESION_NIVEL_GZIP, zlib.DEFLATED, 31)
+    return compresor.compress, compresor.flush
+
+def _comprimir_flujo(fragmentos, codificacion):
+    """Comprime un cuerpo en flujo sin acumularlo"""
+    comprimir, terminar = _compresor(codificacion)
+    try:
+        for fragmento in fragmentos:
+            if isinstance(fragmento, str):
+                fragmento = fragmento.encode('utf-8')
+            datos = comprimir(fragmento)
+            if datos:
+                yield datos
+        yield terminar()
+    finally:
+        # Cierra el generador original para liberar el contexto y la conexión
+        cerrar = getattr(fragmentos, 'close', None)
+        if cerrar:
+            cerrar()
+
+def comprimir_respuesta(response):
+    """after_request: comprime las respuestas JSON de la API si conviene"""
+    if (response.status_code != 200
+            or not request.path.startswith('/api/')
+            or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    codificacion = elegir_codificacion()
+    if codificacion is None:
+        return response
+    
+    if response.is_streamed:
+        response.response = _comprimir_flujo(response.response, codificacion)
+    else:
+        datos = response.get_data()
+        if len(datos) < COMPRESION_MINIMO:
+            return response
+        if codificacion == 'br':
+            datos = brotli.compress(datos, quality=COMPRESION_NIVEL_BROTLI)
+        else:
+            datos = gzip.compress(datos, COMPRESION_NIVEL_GZIP)
+        response.set_data(datos)
+    
+    response.headers['Content-Encoding'] = codificacion
+    return response
+
+def init_app(app):
+    """Registra la compresión de respuestas en la aplicación"""
+    app.after_request(comprimir_respuesta)
@@ -1,12 +1,30 @@
 """
 Rutas de la API del sistema
 """
-from flask import Blueprint, request, jsonify, session
-from models import Usuario, Proyecto, Tarea, Reporte
-from auth import login_required, role_required, get_current_user, verificar_permisos_proyecto
+import sqlite3
+import time
+from flask import Blueprint, Response, request, jsonify, session, stream_with_context
+from models import Usuario, Proyecto, Tarea, Reporte, Busqueda
+from auth import (login_required, role_required, get_current_user, verificar_permisos_proyecto,
+                  emitir_token, iniciar_sesion)
+from cache import cache_reportes
+from database import ENTERO_MAX, ENTERO_MIN, close_db, estadisticas_db
+from eventos import HubLleno, flujo_sse, hub, respuesta_lleno
+from etags import con_etag
+from paginacion import leer_parametros, paginar
+from respuestas import json_en_flujo
+import vencimientos
 
 api = Blueprint('api', __name__)
 
+def es_entero(valor):
+    """Indica si un valor JSON es un entero que cabe en SQLite (bool es subclase de int)"""
+    return isinstance(valor, int) and not isinstance(valor, bool) and ENTERO_MIN <= valor <= ENTERO_MAX
+
+def es_texto(valor):
+    """Indica si un valor JSON es una cadena no vacía"""
+    return isinstance(valor, str) and valor != ''
+
 # ==================== AUTENTICACIÓN ====================
 
 @api.route('/api/auth/login', methods=['POST'])
@@ -23,10 +41,8 @@ def login():
     if not user or not Usuario.verificar_password(user, password):
         return jsonify({'error': 'Credenciales inválidas'}), 401
     
-    # Crear sesión
-    session['user_id'] = user['id']
-    session['user_email'] = user['email']
-    session['user_rol'] = user['rol']
+    # Crear sesión; el token sirve a clientes que no usan cookies (Authorization: Bearer)
+    iniciar_sesion(user)
     
     return jsonify({
         'message': 'Login exitoso',
@@ -35,7 +51,8 @@ def login():
             'nombre': user['nombre'],
             'email': user['email'],
             'rol': user['rol']
-        }
+        },
+        'token': emitir_token(user)
     }), 200
 
 @api.route('/api/auth/logout', methods=['POST'])
@@ -91,15 +108,84 @@ def crear_usuario():
         return jsonify(user), 201
     return jsonify({'error': 'El email ya está registrado'}), 409
 
+@api.route('/api/usuarios/<int:usuario_id>/revocar-sesiones', methods=['POST'])
+@login_required
+def revocar_sesiones(usuario_id):
+    """Invalida todas las sesiones y tokens de un usuario (administradores o el propio usuario)"""
+    user = get_current_user()
+    if user['rol'] != 'Administrador' and user['id'] != usuario_id:
+        return jsonify({'error': 'Acceso denegado'}), 403
+    
+    epoca = Usuario.revocar_sesiones(usuario_id)
+    if epoca is None:
+        return jsonify({'error': 'Usuario no encontrado'}), 404
+    return jsonify({'message': 'Sesiones revocadas', 'epoca_sesion': epoca}), 200
+
+# Máximo de usuarios por petición de alta masiva
+MAX_USUARIOS_BULK = 500
+
+@api.route('/api/usuarios/bulk', methods=['POST'])
+@login_required
+@role_required(['Administrador'])
+def crear_usuarios_bulk():
+    """Da de alta muchos usuarios en una sola transacción (solo administradores)
+    
+    Acepta una lista de usuarios o {'usuarios': [...]}, con los mismos campos
+    que POST /api/usuarios. Si alguno no es válido no se crea ninguno.
+    """
+    data = request.get_json()
+    
+    usuarios = data.get('usuarios') if isinstance(data, dict) else data
+    if not isinstance(usuarios, list) or not usuarios:
+        return jsonify({'error': 'Se requiere una lista de usuarios'}), 400
+    if len(usuarios) > MAX_USUARIOS_BULK:
+        return jsonify({'error': f'Máximo {MAX_USUARIOS_BULK} usuarios por petición'}), 400
+    
+    emails = set()
+    for indice, usuario in enumerate(usuarios):
+        if (not isinstance(usuario, dict) or not es_texto(usuario.get('nombre'))
+                or not es_texto(usuario.get('email')) or not es_texto(usuario.get('password'))):
+            return jsonify({'error': 'Nombre, email y contraseña son requeridos', 'indice': indice}), 400
+        if usuario.get('rol', 'Colaborador') not in ['Administrador', 'Gestor', 'Colaborador']:
+            return jsonify({'error': 'Rol inválido', 'indice': indice}), 400
+        if usuario['email'] in emails:
+            return jsonify({'error': 'Email repetido en la petición', 'indice': indice}), 400
+        emails.add(usuario['email'])
+    
+    # Antes de calcular ningún hash, que es lo costoso
+    registrados = Usuario.emails_registrados(emails)
+    if registrados:
+        return jsonify({'error': 'El email ya está registrado', 'emails': sorted(registrados)}), 409
+    
+    creados = Usuario.crear_varios(usuarios)
+    if creados is None:
+        return jsonify({'error': 'El email ya está registrado'}), 409
+    return jsonify(creados), 201
+
 # ==================== PROYECTOS ====================
 
 @api.route('/api/proyectos', methods=['GET'])
 @login_required
+@con_etag('proyectos', 'tareas', 'usuarios')
 def obtener_proyectos():
-    """Obtiene todos los proyectos según el rol del usuario"""
+    """Obtiene todos los proyectos según el rol del usuario
+    
+    Con ?limit=N[&cursor=...] responde {'items': [...], 'next_cursor': ...};
+    sin limit devuelve la lista completa, serializada en flujo.
+    """
     user = get_current_user()
-    proyectos = Proyecto.obtener_todos(user['id'], user['rol'])
-    return jsonify(proyectos), 200
+    
+    try:
+        limit, despues_de = leer_parametros(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    proyectos = Proyecto.obtener_todos(user['id'], user['rol'],
+                                       limit=limit + 1 if limit else None, despues_de=despues_de,
+                                       en_flujo=not limit)
+    if limit:
+        return jsonify(paginar(proyectos, limit, 'fecha_creacion')), 200
+    return json_en_flujo(proyectos)
 
 @api.route('/api/proyectos', methods=['POST'])
 @login_required
@@ -129,6 +215,7 @@ def crear_proyecto():
 
 @api.route('/api/proyectos/<int:proyecto_id>', methods=['GET'])
 @login_required
+@con_etag('proyectos', 'tareas', 'usuarios')
 def obtener_proyecto(proyecto_id):
     """Obtiene un proyecto específico"""
     user = get_current_user()
@@ -170,28 +257,43 @@ def actualizar_proyecto(proyecto_id):
 
 @api.route('/api/tareas', methods=['GET'])
 @login_required
+@con_etag('proyectos', 'tareas', 'usuarios')
 def obtener_tareas():
-    """Obtiene tareas según el rol del usuario"""
+    """Obtiene tareas según el rol del usuario
+    
+    Admite la misma paginación por cursor que /api/proyectos; sin limit la
+    lista completa se serializa en flujo.
+    """
     user = get_current_user()
     proyecto_id = request.args.get('proyecto_id', type=int)
     estado = request.args.get('estado')
     
+    try:
+        limit, despues_de = leer_parametros(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    pagina = {'limit': limit + 1 if limit else None, 'despues_de': despues_de, 'en_flujo': not limit}
+    
     if estado:
-        tareas = Tarea.obtener_por_estado(estado, user['id'] if user['rol'] == 'Colaborador' else None, proyecto_id)
+        tareas = Tarea.obtener_por_estado(estado, user['id'] if user['rol'] == 'Colaborador' else None, proyecto_id,
+                                          **pagina)
+        clave = 'fecha_limite'
     elif proyecto_id:
         if not verificar_permisos_proyecto(user, proyecto_id):
             return jsonify({'error': 'Acceso denegado'}), 403
-        tareas = Tarea.obtener_por_proyecto(proyecto_id)
+        tareas = Tarea.obtener_por_proyecto(proyecto_id, **pagina)
+        clave = 'fecha_creacion'
     elif user['rol'] == 'Colaborador':
-        tareas = Tarea.obtener_por_usuario(user['id'])
+        tareas = Tarea.obtener_por_usuario(user['id'], **pagina)
+        clave = 'fecha_limite'
     else:
         # Administradores y gestores ven todas las tareas de sus proyectos
-        proyectos = Proyecto.obtener_todos(user['id'], user['rol'])
-        tareas = []
-        for proyecto in proyectos:
-            tareas.extend(Tarea.obtener_por_proyecto(proyecto['id']))
+        tareas = Tarea.obtener_visibles(user['id'], user['rol'], **pagina)
+        clave = 'fecha_creacion'
     
-    return jsonify(tareas), 200
+    if limit:
+        return jsonify(paginar(tareas, limit, clave)), 200
+    return json_en_flujo(tareas)
 
 @api.route('/api/tareas', methods=['POST'])
 @login_required
@@ -219,6 +321,76 @@ def crear_tarea():
         return jsonify(tarea), 201
     return jsonify({'error': 'Error al crear tarea'}), 500
 
+# Máximo de tareas por petición de creación masiva
+MAX_TAREAS_BULK = 1000
+
+@api.route('/api/tareas/bulk', methods=['POST'])
+@login_required
+@role_required(['Administrador', 'Gestor'])
+def crear_tareas_bulk():
+    """Crea muchas tareas en una sola transacción
+    
+    Acepta una lista de tareas o {'tareas': [...]}, con los mismos campos que
+    POST /api/tareas. Si alguna no es válida no se crea ninguna.
+    """
+    data = request.get_json()
+    user = get_current_user()
+    
+    tareas = data.get('tareas') if isinstance(data, dict) else data
+    if not isinstance(tareas, list) or not tareas:
+        return jsonify({'error': 'Se requiere una lista de tareas'}), 400
+    if len(tareas) > MAX_TAREAS_BULK:
+        return jsonify({'error': f'Máximo {MAX_TAREAS_BULK} tareas por petición'}), 400
+    
+    for indice, tarea in enumerate(tareas):
+        if not isinstance(tarea, dict) or not es_texto(tarea.get('titulo')) or not tarea.get('proyecto_id'):
+            return jsonify({'error': 'Título y proyecto son requeridos', 'indice': indice}), 400
+        if any(not isinstance(tarea.get(campo), (str, type(None))) for campo in ('descripcion', 'fecha_limite')):
+            return jsonify({'error': 'Descripción y fecha límite deben ser texto', 'indice': indice}), 400
+        if not es_entero(tarea['proyecto_id']):
+            return jsonify({'error': 'Proyecto inválido', 'indice': indice}), 400
+        if tarea.get('asignado_a_id') is not None and not es_entero(tarea['asignado_a_id']):
+            return jsonify({'error': 'Usuario asignado inválido', 'indice': indice}), 400
+        if tarea.get('prioridad', 'Media') not in ['Baja', 'Media', 'Alta']:
+            return jsonify({'error': 'Prioridad inválida', 'indice': indice}), 400
+    
+    # Permisos una sola vez por proyecto distinto
+    for proyecto_id in {tarea['proyecto_id'] for tarea in tareas}:
+        if not verificar_permisos_proyecto(user, proyecto_id):
+            return jsonify({'error': 'Acceso denegado al proyecto', 'proyecto_id': proyecto_id}), 403
+    
+    try:
+        creadas = Tarea.crear_varias(tareas, user['id'])
+    except sqlite3.IntegrityError:
+        return jsonify({'error': 'Datos de tarea inválidos'}), 400
+    
+    return jsonify(creadas), 201
+
+@api.route('/api/tareas/cambios', methods=['GET'])
+@login_required
+def obtener_cambios_tareas():
+    """Feed incremental de tareas visibles para el usuario
+    
+    Sin ?desde devuelve solo la versión actual, que el cliente guarda antes de
+    cargar el tablero. Con ?desde=<version> devuelve lo cambiado desde
+    entonces; si esos cambios ya se purgaron responde 410 y el cliente debe
+    recargar la lista completa.
+    """
+    user = get_current_user()
+    desde = request.args.get('desde', type=int)
+    
+    if desde is None:
+        return jsonify({'version': Tarea.obtener_version_cambios(), 'hay_mas': False,
+                        'tareas': [], 'eliminadas': []}), 200
+    if not 0 <= desde <= ENTERO_MAX:
+        return jsonify({'error': 'desde debe ser un entero no negativo de 64 bits'}), 400
+    
+    cambios = Tarea.obtener_cambios(desde, user['id'], user['rol'])
+    if cambios is None:
+        return jsonify({'error': 'Cursor caducado, recargue las tareas',
+                        'version': Tarea.obtener_version_cambios()}), 410
+    return jsonify(cambios), 200
+
 @api.route('/api/tareas/<int:tarea_id>', methods=['GET'])
 @login_required
 def obtener_tarea(tarea_id):
@@ -268,19 +440,111 @@ def actualizar_tarea(tarea_id):
             descripcion=data.get('descripcion'),
             asignado_a_id=data.get('asignado_a_id'),
             prioridad=data.get('prioridad'),
-            fecha_limite=data.get('fecha_limite')
+            fecha_limite=data.get('fecha_limite'),
+            estado=data.get('estado')
         )
-        
-        if data.get('estado'):
-            tarea = Tarea.actualizar_estado(tarea_id, data.get('estado'))
     
     return jsonify(tarea), 200
 
+# Máximo de cambios de estado por petición
+MAX_CAMBIOS_ESTADO = 500
+
+@api.route('/api/tareas/estado', methods=['PATCH'])
+@login_required
+def actualizar_estados_tareas():
+    """Mueve varias tareas de estado en una sola transacción
+    
+    Acepta una lista de {'id', 'estado', 'expected_version'} o {'cambios': [...]}.
+    expected_version es opcional; si alguna versión no coincide se responde
+    409 y no se aplica ningún cambio.
+    """
+    data = request.get_json()
+    user = get_current_user()
+    
+    cambios = data.get('cambios') if isinstance(data, dict) else data
+    if not isinstance(cambios, list) or not cambios:
+        return jsonify({'error': 'Se requiere una lista de cambios'}), 400
+    if len(cambios) > MAX_CAMBIOS_ESTADO:
+        return jsonify({'error': f'Máximo {MAX_CAMBIOS_ESTADO} cambios por petición'}), 400
+    
+    for indice, cambio in enumerate(cambios):
+        if (not isinstance(cambio, dict) or not es_entero(cambio.get('id'))
+                or cambio.get('estado') not in ['Pendiente', 'En Progreso', 'Finalizado']):
+            return jsonify({'error': 'Cada cambio requiere id y un estado válido', 'indice': indice}), 400
+        if cambio.get('expected_version') is not None and not es_entero(cambio['expected_version']):
+            return jsonify({'error': 'expected_version debe ser un entero', 'indice': indice}), 400
+    
+    ids = [cambio['id'] for cambio in cambios]
+    if len(set(ids)) != len(ids):
+        return jsonify({'error': 'Una tarea aparece más de una vez'}), 400
+    
+    actuales = Tarea.obtener_varias(ids)
+    no_encontradas = [tarea_id for tarea_id in ids if tarea_id not in actuales]
+    if no_encontradas:
+        return jsonify({'error': 'Tarea no encontrada', 'ids': no_encontradas}), 404
+    
+    # Mismas reglas que PUT /api/tareas/<id>, comprobadas una vez por proyecto
+    if user['rol'] == 'Colaborador':
+        if any(tarea['asignado_a_id'] != user['id'] for tarea in actuales.values()):
+            return jsonify({'error': 'Acceso denegado'}), 403
+    else:
+        for proyecto_id in {tarea['proyecto_id'] for tarea in actuales.values()}:
+            if not verificar_permisos_proyecto(user, proyecto_id):
+                return jsonify({'error': 'Acceso denegado'}), 403
+    
+    tareas, conflictos = Tarea.actualizar_estados(cambios)
+    if conflictos:
+        return jsonify({'error': 'Conflicto de versión', 'conflictos': conflictos}), 409
+    
+    return jsonify(tareas), 200
+
+# ==================== BÚSQUEDA ====================
+
+# Resultados por página cuando no se indica limit
+BUSQUEDA_LIMITE = 20
+
+@api.route('/api/buscar', methods=['GET'])
+@login_required
+def buscar():
+    """Búsqueda de texto completo en tareas o proyectos visibles para el usuario
+    
+    ?q=<texto>&tipo=tareas|proyectos[&proyecto_id=N][&limit=N&cursor=...].
+    Responde {'items': [...], 'next_cursor': ...} ordenado por relevancia; cada
+    resultado lleva el título (o nombre) con las coincidencias entre <mark> y
+    un fragmento de la descripción, ya escapados como HTML.
+    """
+    user = get_current_user()
+    
+    consulta = Busqueda.consulta_fts(request.args.get('q'))
+    if consulta is None:
+        return jsonify({'error': 'El parámetro q es requerido'}), 400
+    
+    tipo = request.args.get('tipo', 'tareas')
+    if tipo not in ('tareas', 'proyectos'):
+        return jsonify({'error': 'Tipo inválido'}), 400
+    
+    proyecto_id = request.args.get('proyecto_id', type=int)
+    
+    try:
+        limit, despues_de = leer_parametros(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    limit = limit or BUSQUEDA_LIMITE
+    
+    if tipo == 'tareas':
+        resultados = Busqueda.tareas(consulta, user['id'], user['rol'], proyecto_id,
+                                     limit=limit + 1, despues_de=despues_de)
+    else:
+        resultados = Busqueda.proyectos(consulta, user['id'], user['rol'],
+                                        limit=limit + 1, despues_de=despues_de)
+    return jsonify(paginar(resultados, limit, 'relevancia')), 200
+
 # ==================== REPORTES ====================
 
 @api.route('/api/reportes/generales', methods=['GET'])
 @login_required
 @role_required(['Administrador'])
+@con_etag('proyectos', 'tareas')
 def obtener_reportes_generales():
     """Obtiene reportes generales del sistema (solo administradores)"""
     metricas = Reporte.obtener_metricas_generales()
@@ -288,6 +552,7 @@ def obtener_reportes_generales():
 
 @api.route('/api/reportes/proyecto/<int:proyecto_id>', methods=['GET'])
 @login_required
+@con_etag('proyectos', 'tareas')
 def obtener_reporte_proyecto(proyecto_id):
     """Obtiene reportes de un proyecto específico"""
     user = get_current_user()
@@ -300,6 +565,7 @@ def obtener_reporte_proyecto(proyecto_id):
 
 @api.route('/api/reportes/usuario/<int:usuario_id>', methods=['GET'])
 @login_required
+@con_etag('tareas')
 def obtener_reporte_usuario(usuario_id):
     """Obtiene reportes de un usuario específico"""
     user = get_current_user()
@@ -311,3 +577,120 @@ def obtener_reporte_usuario(usuario_id):
     metricas = Reporte.obtener_metricas_usuario(usuario_id)
     return jsonify(metricas), 200
 
+
+@api.route('/api/reportes/proyectos', methods=['GET'])
+@login_required
+@con_etag('proyectos', 'tareas')
+def obtener_reportes_proyectos():
+    """Obtiene las métricas de varios proyectos en una sola consulta
+    
+    Acepta ?ids=1,2,3; sin ids devuelve todos los proyectos visibles.
+    """
+    user = get_current_user()
+    
+    visibles = [p['id'] for p in Proyecto.obtener_todos(user['id'], user['rol'])]
+    
+    ids_param = request.args.get('ids')
+    if ids_param:
+        try:
+            solicitados = {int(i) for i in ids_param.split(',') if i.strip()}
+        except ValueError:
+            return jsonify({'error': 'Lista de ids inválida'}), 400
+        
+        if not solicitados.issubset(visibles):
+            return jsonify({'error': 'Acceso denegado'}), 403
+        ids = [i for i in visibles if i in solicitados]
+    else:
+        ids = visibles
+    
+    metricas = Reporte.obtener_metricas_proyectos(ids)
+    return jsonify({str(proyecto_id): datos for proyecto_id, datos in metricas.items()}), 200
+
+@api.route('/api/dashboard', methods=['GET'])
+@login_required
+@con_etag('proyectos', 'tareas', 'usuarios')
+def obtener_dashboard():
+    """Resumen del dashboard del usuario actual en una sola respuesta"""
+    user = get_current_user()
+    return jsonify(Reporte.obtener_resumen_dashboard(user['id'], user['rol'])), 200
+
+@api.route('/api/reportes/cache', methods=['GET'])
+@login_required
+@role_required(['Administrador'])
+def obtener_estadisticas_cache():
+    """Estadísticas de aciertos y fallos de la caché de reportes"""
+    return jsonify(cache_reportes.estadisticas()), 200
+
+@api.route('/api/reportes/cache', methods=['DELETE'])
+@login_required
+@role_required(['Administrador'])
+def limpiar_cache_reportes():
+    """Vacía la caché de reportes de este proceso"""
+    cache_reportes.limpiar()
+    return jsonify({'message': 'Caché de reportes vaciada'}), 200
+
+# ==================== BASE DE DATOS ====================
+
+@api.route('/api/db/estadisticas', methods=['GET'])
+@login_required
+@role_required(['Administrador'])
+def obtener_estadisticas_db():
+    """Cola del escritor, esperas por bloqueo y vencimientos programados de este proceso"""
+    return jsonify({**estadisticas_db(), 'vencimientos': vencimientos.estadisticas()}), 200
+
+# ==================== EVENTOS ====================
+
+# Segundos que un flujo SSE recuerda si el usuario puede ver un proyecto
+EVENTOS_PERMISOS_TTL = 10
+
+@api.route('/api/eventos', methods=['GET'])
+@login_required
+def obtener_eventos():
+    """Flujo Server-Sent Events con los cambios de tareas y proyectos
+    
+    Solo se envían eventos de proyectos que el usuario puede ver, con las
+    mismas reglas que verificar_permisos_proyecto.
+    """
+    user = get_current_user()
+    
+    try:
+        suscripcion = hub.suscribir()
+    except HubLleno:
+        # El navegador reintenta tras el tiempo indicado en vez de ocupar un hilo
+        cuerpo, cabeceras = respuesta_lleno()
+        return Response(cuerpo, status=503, mimetype='text/event-stream', headers=cabeceras)
+    
+    permisos = {}
+    
+    def puede_ver(evento):
+        if user['rol'] == 'Administrador':
+            return True
+        # Una tarea asignada al usuario, o que deja de estarlo, siempre le llega
+        if evento['tipo'] == 'tareas' and any(user['id'] in (t['asignado_a_id'], t.get('asignado_anterior_id'))
+                                               for t in evento['datos']):
+            return True
+        
+        proyecto_id = evento['proyecto_id']
+        entrada = permisos.get(proyecto_id)
+        if entrada and entrada[0] > time.monotonic():
+            return entrada[1]
+        
+        decision = Proyecto.tiene_acceso(proyecto_id, user['id'], user['rol'])
+        # No retener una conexión del pool mientras el flujo sigue abierto
+        close_db()
+        permisos[proyecto_id] = (time.monotonic() + EVENTOS_PERMISOS_TTL, decision)
+        return decision
+    
+    close_db()
+    return Response(
+        stream_with_context(flujo_sse(suscripcion, puede_ver)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@api.route('/api/eventos/estadisticas', methods=['GET'])
+@login_required
+@role_required(['Administrador'])
+def obtener_estadisticas_eventos():
+    """Suscriptores y eventos publicados en este proceso"""
+    return jsonify(hub.estadisticas()), 200
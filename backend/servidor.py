@@ -0,0 +1,121 @@
+"""
+Servidor de producción con varios procesos
+
+Usa gunicorn (workers gthread: varios procesos con varios hilos cada uno)
+cuando está instalado. En Windows, donde gunicorn no funciona, recurre al
+servidor de Werkzeug con hilos en un solo proceso.
+
+Uso:
+    python servidor.py [--workers N] [--hilos N] [--bind HOST:PUERTO]
+
+Cada opción puede darse también por entorno: SERVIDOR_WORKERS,
+SERVIDOR_HILOS, SERVIDOR_BIND, SERVIDOR_GRACIA.
+
+Señales (gunicorn) al proceso principal:
+    HUP   reinicia los workers de forma ordenada
+    TERM  apaga esperando las peticiones en curso hasta SERVIDOR_GRACIA segundos
+"""
+import argparse
+import os
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    BaseApplication = None
+
+import hashing
+import vencimientos
+from app import app
+from database import POOL_SIZE, calentar_pool, get_escritor, init_db, reiniciar_pool
+from eventos import Retransmisor, hub, limite_por_hilos
+from models import Reporte
+
+SERVIDOR_BIND = os.environ.get('SERVIDOR_BIND', '0.0.0.0:5000')
+SERVIDOR_WORKERS = int(os.environ.get('SERVIDOR_WORKERS', str(os.cpu_count() or 1)))
+# Hilos por worker; cada flujo SSE abierto ocupa uno (ver eventos.limite_por_hilos)
+SERVIDOR_HILOS = int(os.environ.get('SERVIDOR_HILOS', '64'))
+# Segundos que un worker espera a sus peticiones al apagarse o recargarse
+SERVIDOR_GRACIA = int(os.environ.get('SERVIDOR_GRACIA', '30'))
+
+def calentar(hilos):
+    """Prepara un worker antes de que acepte peticiones
+    
+    Arranca el hilo escritor, el planificador de vencimientos y los procesos
+    de hashing, abre las conexiones de lectura que usarán sus hilos y calcula
+    las métricas generales, que dejan en memoria las páginas de índices más
+    usadas y el reporte en la caché.
+    """
+    hashing.iniciar()
+    get_escritor()
+    vencimientos.iniciar()
+    calentar_pool(min(hilos, POOL_SIZE))
+    with app.app_context():
+        Reporte.obtener_metricas_generales()
+
+if BaseApplication is not None:
+    class ServidorGunicorn(BaseApplication):
+        """Aplicación gunicorn configurada desde código en lugar de un archivo"""
+        
+        def __init__(self, opciones):
+            self.opciones = opciones
+            self.retransmisor = None
+            super().__init__()
+        
+        def load_config(self):
+            for clave, valor in self.opciones.items():
+                self.cfg.set(clave, valor)
+            self.cfg.set('post_fork', self.post_fork)
+            self.cfg.set('post_worker_init', self.post_worker_init)
+            self.cfg.set('worker_exit', self.worker_exit)
+        
+        def load(self):
+            return app
+        
+        def post_fork(self, server, worker):
+            # Las conexiones abiertas por el proceso principal no se comparten
+            reiniciar_pool()
+        
+        def post_worker_init(self, worker):
+            calentar(self.opciones['threads'])
+            # Cada flujo SSE retiene un hilo gthread mientras está abierto
+            hub.max_suscriptores = limite_por_hilos(self.opciones['threads'])
+            # Cada worker tiene su hub de eventos: replica los cambios de los demás
+            if self.opciones['workers'] > 1:
+                self.retransmisor = Retransmisor()
+                self.retransmisor.start()
+        
+        def worker_exit(self, server, worker):
+            if self.retransmisor is not None:
+                self.retransmisor.parar()
+            vencimientos.parar()
+            hashing.cerrar()
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor de producción del sistema de gestión de proyectos')
+    parser.add_argument('--bind', default=SERVIDOR_BIND, help='HOST:PUERTO donde escuchar')
+    parser.add_argument('--workers', type=int, default=SERVIDOR_WORKERS, help='procesos de trabajo')
+    parser.add_argument('--hilos', type=int, default=SERVIDOR_HILOS, help='hilos por proceso')
+    parser.add_argument('--gracia', type=int, default=SERVIDOR_GRACIA,
+                        help='segundos de espera a las peticiones en curso al apagar o recargar')
+    args = parser.parse_args()
+    
+    # Esquema y migraciones una sola vez, antes de crear los workers
+    init_db()
+    
+    if BaseApplication is None:
+        print("gunicorn no está disponible: se usa un único proceso con hilos")
+        calentar(args.hilos)
+        host, _, puerto = args.bind.rpartition(':')
+        app.run(host=host or '0.0.0.0', port=int(puerto), threaded=True)
+        return
+    
+    ServidorGunicorn({
+        'bind': args.bind,
+        'workers': args.workers,
+        'worker_class': 'gthread',
+        'threads': args.hilos,
+        'graceful_timeout': args.gracia,
+    }).run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Pruebas de validación de las operaciones masivas de la API
+
+Cada petición mal formada debe responder 400 con el índice del elemento que
+falla, nunca 500. Usan una base de datos temporal.
+
+Uso (desde backend/):
+    python -m unittest test_validacion
+"""
+import os
+import tempfile
+import unittest
+
+# Hashes en el propio hilo: no hace falta arrancar procesos para las pruebas
+os.environ.setdefault('HASH_PROCESOS', '0')
+
+import database
+
+class PruebaApi(unittest.TestCase):
+    """Base de datos temporal con un administrador y un proyecto"""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.directorio = tempfile.TemporaryDirectory()
+        database.DATABASE = os.path.join(cls.directorio.name, 'pruebas.db')
+        database.init_db()
+        
+        from app import app
+        app.config['TESTING'] = True
+        cls.admin = app.test_client()
+        respuesta = cls.admin.post('/api/auth/login', json={'email': 'admin@proyectos.com',
+                                                            'password': 'admin123'})
+        assert respuesta.status_code == 200, respuesta.get_json()
+        
+        respuesta = cls.admin.post('/api/proyectos', json={'nombre': 'Pruebas', 'fecha_inicio': '2024-01-01',
+                                                           'fecha_fin': '2024-12-31'})
+        cls.proyecto_id = respuesta.get_json()['id']
+    
+    @classmethod
+    def tearDownClass(cls):
+        database.get_escritor().parar()
+        database.get_escritor().join(5)
+        database.get_pool().close_all()
+        cls.directorio.cleanup()
+    
+    def assertRechazado(self, metodo, url, cuerpo, indice):
+        """La petición responde 400 señalando el elemento `indice`"""
+        respuesta = metodo(url, json=cuerpo)
+        self.assertEqual(respuesta.status_code, 400, (cuerpo, respuesta.get_json()))
+        self.assertEqual(respuesta.get_json().get('indice'), indice, cuerpo)
+
+class AltaMasivaUsuarios(PruebaApi):
+    """POST /api/usuarios/bulk"""
+    
+    def usuario(self, n, **campos):
+        return {'nombre': f'Usuario {n}', 'email': f'usuario{n}@pruebas.com', 'password': 'clave', **campos}
+    
+    def test_campos_que_no_son_texto(self):
+        for campos in ({'email': ['x']}, {'password': 5}, {'nombre': {'a': 1}},
+                       {'password': True}, {'email': None}, {'nombre': ''}):
+            with self.subTest(campos=campos):
+                self.assertRechazado(self.admin.post, '/api/usuarios/bulk',
+                                     [self.usuario(1), self.usuario(2, **campos)], 1)
+    
+    def test_email_repetido(self):
+        self.assertRechazado(self.admin.post, '/api/usuarios/bulk',
+                             [self.usuario(1), self.usuario(2, email='usuario1@pruebas.com')], 1)
+    
+    def test_rol_invalido(self):
+        self.assertRechazado(self.admin.post, '/api/usuarios/bulk', [self.usuario(1, rol=['Gestor'])], 0)
+    
+    def test_alta_valida(self):
+        respuesta = self.admin.post('/api/usuarios/bulk', json=[self.usuario(10), self.usuario(11)])
+        self.assertEqual(respuesta.status_code, 201, respuesta.get_json())
+        self.assertEqual(len(respuesta.get_json()), 2)
+
+class AltaMasivaTareas(PruebaApi):
+    """POST /api/tareas/bulk"""
+    
+    def tarea(self, **campos):
+        return {'titulo': 'Tarea', 'proyecto_id': self.proyecto_id, **campos}
+    
+    def test_tipos_invalidos(self):
+        for campos in ({'titulo': ['x']}, {'titulo': 5}, {'titulo': ''}, {'descripcion': 3},
+                       {'fecha_limite': ['2024-01-01']}, {'proyecto_id': True}, {'proyecto_id': str(self.proyecto_id)},
+                       {'asignado_a_id': True}, {'asignado_a_id': 'x'}, {'prioridad': 'Urgente'}):
+            with self.subTest(campos=campos):
+                self.assertRechazado(self.admin.post, '/api/tareas/bulk', [self.tarea(), self.tarea(**campos)], 1)
+    
+    def test_enteros_fuera_de_rango(self):
+        for campos in ({'proyecto_id': 2 ** 63}, {'asignado_a_id': 2 ** 63}, {'asignado_a_id': -2 ** 63 - 1}):
+            with self.subTest(campos=campos):
+                self.assertRechazado(self.admin.post, '/api/tareas/bulk', [self.tarea(), self.tarea(**campos)], 1)
+    
+    def test_alta_valida(self):
+        respuesta = self.admin.post('/api/tareas/bulk', json=[
+            self.tarea(), self.tarea(descripcion=None, fecha_limite=None, asignado_a_id=None)])
+        self.assertEqual(respuesta.status_code, 201, respuesta.get_json())
+        self.assertEqual(len(respuesta.get_json()), 2)
+
+class CambiosEstadoMasivos(PruebaApi):
+    """PATCH /api/tareas/estado"""
+    
+    def setUp(self):
+        respuesta = self.admin.post('/api/tareas', json={'titulo': 'Tarea', 'proyecto_id': self.proyecto_id})
+        self.tarea_id = respuesta.get_json()['id']
+    
+    def test_ids_invalidos(self):
+        for tarea_id in (True, '1', None, 2 ** 63, -2 ** 63 - 1):
+            with self.subTest(id=tarea_id):
+                self.assertRechazado(self.admin.patch, '/api/tareas/estado', [
+                    {'id': self.tarea_id, 'estado': 'Finalizado'}, {'id': tarea_id, 'estado': 'Finalizado'}], 1)
+    
+    def test_versiones_invalidas(self):
+        for version in (True, '0', 2 ** 64):
+            with self.subTest(expected_version=version):
+                self.assertRechazado(self.admin.patch, '/api/tareas/estado', [
+                    {'id': self.tarea_id, 'estado': 'Finalizado', 'expected_version': version}], 0)
+    
+    def test_estado_invalido(self):
+        self.assertRechazado(self.admin.patch, '/api/tareas/estado', [{'id': self.tarea_id, 'estado': 'Hecho'}], 0)
+    
+    def test_cambio_valido(self):
+        respuesta = self.admin.patch('/api/tareas/estado', json=[{'id': self.tarea_id, 'estado': 'Finalizado'}])
+        self.assertEqual(respuesta.status_code, 200, respuesta.get_json())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+"""
+Planificador de vencimientos de tareas
+
+La columna tareas.retrasada (migración 11) la fijan los triggers cada vez que
+se escribe una tarea; lo que queda es el paso del tiempo. Las fechas límite
+son días, así que una tarea abierta pasa a retrasada a las 00:00 UTC del día
+siguiente a su fecha límite, cuando date('now') la supera.
+
+El planificador guarda en un montículo (heapq) esos instantes para las
+próximas fechas límite de tareas abiertas, duerme hasta el más cercano y
+entonces marca de una vez todas las tareas vencidas. Las fechas nuevas de
+este proceso se añaden con programar(); las escritas por otros procesos se
+recogen al releer el índice cada VENCIMIENTOS_RELECTURA segundos. Varios
+procesos pueden barrer a la vez: el UPDATE solo toca filas aún sin marcar.
+"""
+import heapq
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, time as hora, timedelta, timezone
+
+from database import EscritorNoDisponible, release_thread_connection
+
+# Segundos entre relecturas de las próximas fechas límite desde la base de datos
+VENCIMIENTOS_RELECTURA = float(os.environ.get('VENCIMIENTOS_RELECTURA', '3600'))
+# Fechas límite distintas que se cargan en el montículo en cada relectura
+VENCIMIENTOS_MAX_PROGRAMADOS = 1000
+
+def instante_vencimiento(fecha_limite):
+    """Timestamp en que vence una fecha límite 'AAAA-MM-DD': 00:00 UTC del día siguiente"""
+    dia = date.fromisoformat(fecha_limite) + timedelta(days=1)
+    return datetime.combine(dia, hora(0), tzinfo=timezone.utc).timestamp()
+
+class PlanificadorVencimientos(threading.Thread):
+    """Marca las tareas como retrasadas en el momento en que vencen"""
+    
+    def __init__(self, relectura=VENCIMIENTOS_RELECTURA):
+        super().__init__(name='planificador-vencimientos', daemon=True)
+        self.relectura = relectura
+        self._monticulo = []
+        self._programados = set()
+        self._condicion = threading.Condition()
+        self._parar = False
+        self.barridos = 0
+        self.marcadas = 0
+    
+    def programar(self, fecha_limite):
+        """Añade el vencimiento de una fecha límite si es futuro y no estaba ya"""
+        if not fecha_limite:
+            return
+        try:
+            instante = instante_vencimiento(fecha_limite)
+        except ValueError:
+            return
+        if instante <= time.time():
+            return
+        
+        with self._condicion:
+            if instante in self._programados:
+                return
+            self._programados.add(instante)
+            heapq.heappush(self._monticulo, instante)
+            # Si es el más cercano, el hilo debe acortar su espera
+            if self._monticulo[0] == instante:
+                self._condicion.notify()
+    
+    def _cargar(self):
+        """Programa las próximas fechas límite de tareas abiertas (índice parcial)"""
+        from models import Tarea
+        
+        try:
+            fechas = Tarea.proximas_fechas_limite(VENCIMIENTOS_MAX_PROGRAMADOS)
+        finally:
+            release_thread_connection()
+        for fecha_limite in fechas:
+            self.programar(fecha_limite)
+    
+    def barrer(self):
+        """Marca como retrasadas las tareas abiertas ya vencidas y devuelve cuántas"""
+        from models import Tarea
+        
+        marcadas = Tarea.marcar_retrasadas()
+        with self._condicion:
+            self.barridos += 1
+            self.marcadas += len(marcadas)
+        return len(marcadas)
+    
+    def run(self):
+        proxima_lectura = 0.0
+        while True:
+            try:
+                if time.time() >= proxima_lectura:
+                    # También al arrancar: recupera lo vencido mientras no hubo servidor
+                    self.barrer()
+                    self._cargar()
+                    proxima_lectura = time.time() + self.relectura
+                
+                with self._condicion:
+                    vencidos = False
+                    while self._monticulo and self._monticulo[0] <= time.time():
+                        self._programados.discard(heapq.heappop(self._monticulo))
+                        vencidos = True
+                    
+                    if not vencidos:
+                        limite = proxima_lectura
+                        if self._monticulo:
+                            limite = min(limite, self._monticulo[0])
+                        if not self._parar:
+                            self._condicion.wait(max(0.0, limite - time.time()))
+                    if self._parar:
+                        return
+                
+                if vencidos:
+                    self.barrer()
+            except (sqlite3.Error, EscritorNoDisponible):
+                # Base de datos ocupada: se reintenta en la siguiente vuelta
+                time.sleep(1)
+    
+    def estadisticas(self):
+        """Vencimientos programados, barridos hechos y tareas marcadas"""
+        with self._condicion:
+            return {
+                'programados': len(self._monticulo),
+                'proximo': (datetime.fromtimestamp(self._monticulo[0], timezone.utc).isoformat()
+                            if self._monticulo else None),
+                'barridos': self.barridos,
+                'marcadas': self.marcadas
+            }
+    
+    def parar(self):
+        """Detiene el hilo"""
+        with self._condicion:
+            self._parar = True
+            self._condicion.notify()
+
+_planificador = None
+_planificador_lock = threading.Lock()
+
+def iniciar():
+    """Arranca el planificador del proceso (una sola vez) y lo devuelve"""
+    global _planificador
+    with _planificador_lock:
+        if _planificador is None or not _planificador.is_alive():
+            _planificador = PlanificadorVencimientos()
+            _planificador.start()
+        return _planificador
+
+def asegurar():
+    """Arranca el planificador si el proceso no lo tiene y no se detuvo a propósito"""
+    if _planificador is None or (not _planificador.is_alive() and not _planificador._parar):
+        iniciar()
+
+def init_app(app):
+    """Arranca el planificador con la primera petición de cada proceso
+    
+    Así también funciona con `gunicorn app:app` o `flask run`, sin pasar por
+    servidor.py. El proceso padre del recargador de Werkzeug no atiende
+    peticiones, de modo que no arranca ninguno.
+    """
+    app.before_request(asegurar)
+
+def programar(fecha_limite):
+    """Avisa al planificador de una fecha límite nueva, si está en marcha"""
+    if _planificador is not None:
+        _planificador.programar(fecha_limite)
+
+def parar():
+    """Detiene el planificador del proceso, si está en marcha"""
+    if _planificador is not None:
+        _planificador.parar()
+
+def estadisticas():
+    """Estadísticas del planificador del proceso, o None si no está en marcha"""
+    return _planificador.estadisticas() if _planificador is not None else None
@@ -37,17 +37,10 @@ function getPriorityColor(prioridad) {
 }
 
 /**
- * Verifica si una tarea está retrasada
+ * Verifica si una tarea está retrasada (marca calculada por el servidor)
  */
 function isTaskOverdue(tarea) {
-    if (tarea.estado === 'Finalizado') return false;
-    if (!tarea.fecha_limite) return false;
-    
-    const fechaLimite = new Date(tarea.fecha_limite);
-    const hoy = new Date();
-    hoy.setHours(0, 0, 0, 0);
-    
-    return fechaLimite < hoy;
+    return Boolean(tarea.retrasada);
 }
 
 /**
@@ -73,3 +73,29 @@ async function actualizarEstadoTarea(tareaId, nuevoEstado) {
     }
 }
 
+
+/**
+ * Mueve varias tareas de estado en una sola petición
+ *
+ * cambios: [{ id, estado, expected_version }]. Lanza un error con
+ * status 409 si alguna tarea cambió desde que se cargó el tablero.
+ */
+async function actualizarEstadoTareas(cambios) {
+    const response = await fetch('/api/tareas/estado', {
+        method: 'PATCH',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        credentials: 'include',
+        body: JSON.stringify(cambios)
+    });
+    
+    if (!response.ok) {
+        const error = await response.json().catch(() => ({}));
+        const err = new Error(error.error || 'Error al actualizar tareas');
+        err.status = response.status;
+        throw err;
+    }
+    
+    return response.json();
+}